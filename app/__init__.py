@@ -1,11 +1,149 @@
 import logging
 
 from flask import Flask
-from sqlalchemy import event
+from sqlalchemy import event, inspect, text
 
 from app.config import Config
 from app.extensions import db
 
+# Applied to every new SQLite connection. auto_vacuum only takes effect on
+# a new database (or at the next VACUUM), so it must come first, before
+# anything writes the file header. The rest are per-connection runtime
+# settings: WAL with NORMAL sync, temp tables in memory, a 64 MiB page
+# cache, 256 MiB of mmap I/O, a 5 s busy wait instead of failing with
+# "database is locked", a cap on how large the WAL file may stay, and
+# sampled (bounded-cost) ANALYZE runs.
+SQLITE_PRAGMAS = (
+    "PRAGMA auto_vacuum=INCREMENTAL",
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA journal_size_limit=67108864",
+    "PRAGMA wal_autocheckpoint=1000",
+    "PRAGMA analysis_limit=1000",
+)
+
+# Fold the row :dup into :keep, another spelling of the same IP: move its
+# history over and combine the per-row fields. Clearing latency_count has
+# the missing_only recompute rebuild the aggregates from the merged history.
+_MERGE_IP = (
+    text("UPDATE test_results SET ip_id = :keep WHERE ip_id = :dup"),
+    text("""
+        UPDATE ips SET
+            total_tests = COALESCE(total_tests, 0) + COALESCE(
+                (SELECT total_tests FROM ips WHERE id = :dup), 0),
+            is_active = MAX(COALESCE(is_active, 0), COALESCE(
+                (SELECT is_active FROM ips WHERE id = :dup), 0)),
+            first_seen = COALESCE(MIN(first_seen,
+                (SELECT first_seen FROM ips WHERE id = :dup)), first_seen,
+                (SELECT first_seen FROM ips WHERE id = :dup)),
+            last_tested = COALESCE(MAX(last_tested,
+                (SELECT last_tested FROM ips WHERE id = :dup)), last_tested,
+                (SELECT last_tested FROM ips WHERE id = :dup)),
+            colo_code = COALESCE(colo_code,
+                (SELECT colo_code FROM ips WHERE id = :dup)),
+            latency_count = NULL
+        WHERE id = :keep
+    """),
+    text("DELETE FROM ips WHERE id = :dup"),
+)
+
+# Indexes made redundant by newer ones, dropped from existing databases.
+OBSOLETE_INDEXES = (
+    "ix_test_results_ip_id",
+    "ix_test_results_test_time",
+    "ix_ips_is_active",
+)
+
+
+def _canonicalize_ips(conn):
+    """Store every IP under its canonical spelling, with ``ip_packed`` set.
+
+    Older databases may hold rows without a packed address, and IPv6
+    addresses in more than one spelling (IPv4 has only one). Rows that
+    spell the same IP are merged into the one already in canonical form,
+    or else the oldest, before it is renamed, so neither unique index is
+    violated.
+    """
+    from app.services.ip_service import normalize_ip
+
+    rows = conn.execute(
+        text(
+            "SELECT id, ip_address, ip_packed FROM ips "
+            "WHERE ip_packed IS NULL OR ip_address LIKE '%:%' ORDER BY id"
+        )
+    ).all()
+    spellings = {}
+    for row in rows:
+        spellings.setdefault(normalize_ip(row.ip_address), []).append(row)
+
+    for (address, packed), group in spellings.items():
+        keep = next((r for r in group if r.ip_address == address), group[0])
+        for row in group:
+            if row is not keep:
+                for stmt in _MERGE_IP:
+                    conn.execute(stmt, {"keep": keep.id, "dup": row.id})
+        if (keep.ip_address, keep.ip_packed) != (address, packed):
+            conn.execute(
+                text(
+                    "UPDATE ips SET ip_address = :address, ip_packed = :packed "
+                    "WHERE id = :id"
+                ),
+                {"id": keep.id, "address": address, "packed": packed},
+            )
+
+
+def _upgrade_schema():
+    """Bring an existing database in line with the models.
+
+    ``create_all`` only creates missing tables, so columns and indexes
+    added to a table after it was first created are created here.  New
+    columns must be nullable.
+    """
+    inspector = inspect(db.engine)
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    conn.execute(
+                        text(
+                            f"ALTER TABLE {table.name} ADD COLUMN {column.name} "
+                            f"{column.type.compile(db.engine.dialect)}"
+                        )
+                    )
+
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+
+    from app.services.ip_service import recompute_ip_stats
+
+    with db.engine.begin() as conn:
+        for name in OBSOLETE_INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        _canonicalize_ips(conn)
+
+    # IPs recorded before the running sums existed.
+    recompute_ip_stats(missing_only=True)
+    db.session.commit()
+
+
+def _analyze_if_needed():
+    """Gather planner statistics for databases that have none yet.
+
+    From then on ``PRAGMA optimize`` keeps them current.
+    """
+    with db.engine.begin() as conn:
+        analyzed = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'")
+        ).first() and conn.execute(text("SELECT 1 FROM sqlite_stat1 LIMIT 1")).first()
+        if not analyzed:
+            conn.execute(text("ANALYZE"))
+
 
 def create_app(config=None):
     app = Flask(__name__)
@@ -25,11 +163,23 @@ def create_app(config=None):
         @event.listens_for(db.engine, "connect")
         def _set_sqlite_pragma(dbapi_connection, connection_record):
             cursor = dbapi_connection.cursor()
-            cursor.execute("PRAGMA journal_mode=WAL")
-            cursor.execute("PRAGMA synchronous=NORMAL")
+            for pragma in SQLITE_PRAGMAS:
+                cursor.execute(pragma)
+            cursor.close()
+
+        # Refresh planner statistics for tables this connection queried
+        # before it goes away.
+        @event.listens_for(db.engine, "close")
+        def _optimize_sqlite(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA optimize")
             cursor.close()
 
+        from app import models  # noqa: F401  (register tables before create_all)
+
         db.create_all()
+        _upgrade_schema()
+        _analyze_if_needed()
 
     from app.api import api_bp
     from app.dashboard import dashboard_bp
@@ -3,15 +3,39 @@ import threading
 from datetime import date, datetime, timedelta, timezone
 from functools import wraps
 
-from flask import current_app, jsonify, request, session
-from sqlalchemy import func
+from flask import current_app, jsonify, request, session, stream_with_context
+from sqlalchemy import bindparam, func, select, text
 
 from app.api import api_bp
-from app.extensions import db
-from app.models import IP, ScanSession, TestResult
+from app.extensions import commit_generation, db, db_write_lock
+from app.models import (
+    IP,
+    IP_ROW_COLUMNS,
+    ScanSession,
+    TestResult,
+    TestResultHourly,
+    ip_row_to_dict,
+)
+from app.services.ip_service import get_ip
 
 logger = logging.getLogger(__name__)
 
+# Active IPs whose last :last_n tests all had no download speed. Built once
+# so the SQL text (and its prepared statement) is shared across requests.
+_DEAD_IPS_BY_TESTS = text("""
+    SELECT ip_id FROM (
+        SELECT ip_id, download_speed_mbps,
+            ROW_NUMBER() OVER (
+                PARTITION BY ip_id ORDER BY test_time DESC
+            ) AS rn
+        FROM test_results
+        WHERE ip_id IN (SELECT id FROM ips WHERE is_active IS 1)
+    )
+    WHERE rn <= :last_n
+    GROUP BY ip_id
+    HAVING SUM(CASE WHEN download_speed_mbps > 0 THEN 1 ELSE 0 END) = 0
+""")
+
 VALID_SORT_COLUMNS = {
     "ip_address",
     "avg_latency",
@@ -24,6 +48,52 @@ VALID_SORT_COLUMNS = {
     "smart_score",
 }
 
+# ORDER BY clause for each (column, direction) the /ips endpoint accepts,
+# built once. smart_score is computed in Python and has no entry.
+_IPS_ORDER_BY = {
+    (name, direction): (
+        getattr(IP, name).desc() if direction == "DESC" else getattr(IP, name).asc()
+    )
+    for name in VALID_SORT_COLUMNS - {"smart_score"}
+    for direction in ("ASC", "DESC")
+}
+
+
+# Every scalar on the stats panel in one statement: a single pass over the
+# active IPs for the count and aggregates, with the two test counts as
+# scalar subqueries.
+_STATS_SUMMARY = select(
+    func.count(),
+    select(func.count()).select_from(TestResult).scalar_subquery(),
+    select(func.count())
+    .where(TestResult.test_time >= bindparam("today_start"))
+    .scalar_subquery(),
+    func.avg(IP.avg_latency),
+    func.avg(IP.avg_download_speed),
+    func.avg(IP.avg_loss_rate),
+    func.min(IP.best_latency),
+    func.max(IP.best_download_speed),
+).where(IP.is_active.is_(True))
+
+
+# Catches writes by other processes (e.g. a separate monitor) that the
+# commit generation does not see: test results added or pruned, a scan
+# recorded, the number of active IPs changing. Each part is an index
+# lookup or a scan of the small ips table.
+_STATS_VERSION = select(
+    select(func.max(TestResult.id)).scalar_subquery(),
+    select(func.min(TestResult.id)).scalar_subquery(),
+    select(func.max(ScanSession.id)).scalar_subquery(),
+    select(func.count())
+    .select_from(IP)
+    .where(IP.is_active.is_(True))
+    .scalar_subquery(),
+)
+
+# (version key, stats) of the last /stats computation, reused while the
+# key is unchanged. Any commit in this process changes the key.
+_stats_cache = (None, None)
+
 
 def login_required_api(f):
     @wraps(f)
@@ -61,22 +131,35 @@ def compute_smart_score(ip_dict, max_speed, max_latency, reliable_tests=5):
 @api_bp.route("/stats")
 @login_required_api
 def get_stats():
-    total_active = IP.query.filter_by(is_active=True).count()
-    total_tests = TestResult.query.count()
-    tests_today = TestResult.query.filter(
-        TestResult.test_time >= datetime.combine(date.today(), datetime.min.time())
-    ).count()
-
-    row = db.session.query(
-        func.avg(IP.avg_latency),
-        func.avg(IP.avg_download_speed),
-        func.avg(IP.avg_loss_rate),
-        func.min(IP.best_latency),
-        func.max(IP.best_download_speed),
-    ).filter(IP.is_active == True).first()  # noqa: E712
+    global _stats_cache
+
+    today_start = datetime.combine(date.today(), datetime.min.time())
+    key = (
+        commit_generation(),
+        *db.session.execute(_STATS_VERSION).one(),
+        today_start,
+    )
+    cached_key, stats = _stats_cache
+    if cached_key != key:
+        stats = _compute_stats(today_start)
+        _stats_cache = (key, stats)
+
+    return jsonify(
+        {
+            **stats,
+            "monitor": current_app.monitor.get_status(),
+            "scanner": current_app.scanner.get_scan_status(),
+        }
+    )
+
+
+def _compute_stats(today_start):
+    total_active, total_tests, tests_today, *row = db.session.execute(
+        _STATS_SUMMARY, {"today_start": today_start}
+    ).one()
 
     top_ips = (
-        IP.query.filter_by(is_active=True)
+        IP.query.filter(IP.is_active.is_(True))
         .order_by(IP.avg_download_speed.desc())
         .limit(5)
         .all()
@@ -86,7 +169,7 @@ def get_stats():
         ScanSession.query.order_by(ScanSession.scan_time.desc()).limit(5).all()
     )
 
-    stats = {
+    return {
         "total_active_ips": total_active,
         "total_tests": total_tests,
         "tests_today": tests_today,
@@ -97,10 +180,7 @@ def get_stats():
         "best_speed": round(row[4] or 0, 2),
         "top_ips": [ip.to_dict() for ip in top_ips],
         "recent_scans": [s.to_dict() for s in recent_scans],
-        "monitor": current_app.monitor.get_status(),
-        "scanner": current_app.scanner.get_scan_status(),
     }
-    return jsonify(stats)
 
 
 @api_bp.route("/ips")
@@ -111,15 +191,14 @@ def get_ips():
     search = request.args.get("search")
     active_only = request.args.get("active", "true").lower() == "true"
 
-    query = IP.query
+    query = select(*IP_ROW_COLUMNS)
     if active_only:
-        query = query.filter_by(is_active=True)
+        query = query.where(IP.is_active.is_(True))
     if search:
-        query = query.filter(IP.ip_address.like(f"%{search}%"))
+        query = query.where(_ip_search_filter(search))
 
     if order_by == "smart_score":
-        ips = query.all()
-        result = [ip.to_dict() for ip in ips]
+        result = [ip_row_to_dict(row) for row in db.session.execute(query)]
         max_speed = max((d["avg_download_speed"] or 0 for d in result), default=1)
         max_latency = max((d["avg_latency"] or 0 for d in result), default=1)
         for d in result:
@@ -129,13 +208,44 @@ def get_ips():
         result.sort(key=lambda d: d["smart_score"], reverse=True)
         return jsonify({"ips": result, "total": len(result)})
 
-    if order_by in VALID_SORT_COLUMNS:
-        col = getattr(IP, order_by)
-        query = query.order_by(col.desc() if order_dir == "DESC" else col.asc())
+    order_clause = _IPS_ORDER_BY.get(
+        (order_by, "DESC" if order_dir == "DESC" else "ASC")
+    )
+    if order_clause is not None:
+        query = query.order_by(order_clause)
+
+    return current_app.response_class(
+        stream_with_context(
+            _stream_ips(db.session.execute(query.execution_options(yield_per=500)))
+        ),
+        mimetype="application/json",
+    )
 
-    ips = query.all()
-    result = [ip.to_dict() for ip in ips]
-    return jsonify({"ips": result, "total": len(result)})
+
+def _ip_search_filter(search):
+    """WHERE clause for an IP search term.
+
+    A trailing ``*`` asks for a prefix ("104.16.*"), answered as a range
+    scan on the ip_address index; anything else is a substring match.
+    """
+    if search.endswith("*"):
+        prefix = search.rstrip("*")
+        if not prefix:
+            return db.true()
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        return (IP.ip_address >= prefix) & (IP.ip_address < upper)
+    return IP.ip_address.like(f"%{search}%")
+
+
+def _stream_ips(ips):
+    """Serialize ``{"ips": [...], "total": n}`` one IP at a time."""
+    dumps = current_app.json.dumps
+    total = 0
+    yield '{"ips": ['
+    for ip in ips:
+        yield ("," if total else "") + dumps(ip_row_to_dict(ip))
+        total += 1
+    yield f'], "total": {total}}}'
 
 
 @api_bp.route("/ip")
@@ -145,7 +255,7 @@ def get_ip_detail():
     if not ip_address:
         return jsonify({"error": "IP required"}), 400
 
-    ip = IP.query.filter_by(ip_address=ip_address).first()
+    ip = get_ip(ip_address)
     if not ip:
         return jsonify({"error": "IP not found"}), 404
 
@@ -160,7 +270,7 @@ def get_history():
     if not ip_address:
         return jsonify({"error": "IP required"}), 400
 
-    ip = IP.query.filter_by(ip_address=ip_address).first()
+    ip = get_ip(ip_address)
     if not ip:
         return jsonify({"ip": ip_address, "history": []})
 
@@ -181,27 +291,26 @@ def get_hourly():
     hours = int(request.args.get("hours", 24))
     cutoff = datetime.now(timezone.utc) - timedelta(hours=hours)
 
+    # Whole hours from the rollup table, starting with the hour the cutoff
+    # falls in.
     stats = (
-        db.session.query(
-            func.strftime("%Y-%m-%d %H:00", TestResult.test_time).label("hour"),
-            func.count().label("test_count"),
-            func.avg(TestResult.latency_ms).label("avg_latency"),
-            func.avg(TestResult.download_speed_mbps).label("avg_speed"),
-            func.avg(TestResult.loss_rate).label("avg_loss"),
+        TestResultHourly.query.filter(
+            TestResultHourly.hour >= cutoff.strftime("%Y-%m-%d %H:00")
         )
-        .filter(TestResult.test_time >= cutoff)
-        .group_by("hour")
-        .order_by("hour")
+        .order_by(TestResultHourly.hour)
         .all()
     )
 
+    def avg(total, count):
+        return total / count if count else 0
+
     result = [
         {
             "hour": s.hour,
             "test_count": s.test_count,
-            "avg_latency": round(s.avg_latency or 0, 2),
-            "avg_speed": round(s.avg_speed or 0, 2),
-            "avg_loss": round(s.avg_loss or 0, 4),
+            "avg_latency": round(avg(s.latency_sum, s.latency_count), 2),
+            "avg_speed": round(avg(s.speed_sum, s.speed_count), 2),
+            "avg_loss": round(avg(s.loss_sum, s.loss_count), 4),
         }
         for s in stats
     ]
@@ -342,10 +451,11 @@ def deactivate_ip():
     if not ip_address:
         return jsonify({"error": "IP required"}), 400
 
-    ip = IP.query.filter_by(ip_address=ip_address).first()
-    if ip:
-        ip.is_active = False
-        db.session.commit()
+    with db_write_lock:
+        ip = get_ip(ip_address)
+        if ip:
+            ip.is_active = False
+            db.session.commit()
 
     return jsonify({"status": "deactivated", "ip": ip_address})
 
@@ -353,8 +463,9 @@ def deactivate_ip():
 @api_bp.route("/ips/deactivate-all", methods=["POST"])
 @login_required_api
 def deactivate_all_ips():
-    count = IP.query.filter_by(is_active=True).update({"is_active": False})
-    db.session.commit()
+    with db_write_lock:
+        count = IP.query.filter(IP.is_active.is_(True)).update({"is_active": False})
+        db.session.commit()
     return jsonify({"status": "deactivated", "count": count})
 
 
@@ -381,7 +492,7 @@ def deactivate_dead_ips():
         dead_ids = (
             db.session.query(TestResult.ip_id)
             .join(IP)
-            .filter(IP.is_active == True, TestResult.test_time >= cutoff)  # noqa: E712
+            .filter(IP.is_active.is_(True), TestResult.test_time >= cutoff)
             .group_by(TestResult.ip_id)
             .having(
                 func.sum(
@@ -392,32 +503,19 @@ def deactivate_dead_ips():
         )
     else:
         # "tests" mode — use window function via raw SQL
-        from sqlalchemy import text
-
         dead_ids = db.session.execute(
-            text("""
-                SELECT ip_id FROM (
-                    SELECT ip_id, download_speed_mbps,
-                        ROW_NUMBER() OVER (
-                            PARTITION BY ip_id ORDER BY test_time DESC
-                        ) AS rn
-                    FROM test_results
-                    WHERE ip_id IN (SELECT id FROM ips WHERE is_active = 1)
-                )
-                WHERE rn <= :last_n
-                GROUP BY ip_id
-                HAVING SUM(CASE WHEN download_speed_mbps > 0 THEN 1 ELSE 0 END) = 0
-            """),
+            _DEAD_IPS_BY_TESTS,
             {"last_n": value},
         ).fetchall()
 
     ids = [row[0] for row in dead_ids]
     count = 0
     if ids:
-        count = IP.query.filter(IP.id.in_(ids)).update(
-            {"is_active": False}, synchronize_session=False
-        )
-        db.session.commit()
+        with db_write_lock:
+            count = IP.query.filter(IP.id.in_(ids)).update(
+                {"is_active": False}, synchronize_session=False
+            )
+            db.session.commit()
 
     return jsonify({"status": "deactivated", "count": count, "mode": mode, "value": value})
 
@@ -434,7 +532,7 @@ def preview_dead_ips():
         dead_ids = (
             db.session.query(TestResult.ip_id)
             .join(IP)
-            .filter(IP.is_active == True, TestResult.test_time >= cutoff)  # noqa: E712
+            .filter(IP.is_active.is_(True), TestResult.test_time >= cutoff)
             .group_by(TestResult.ip_id)
             .having(
                 func.sum(
@@ -444,22 +542,8 @@ def preview_dead_ips():
             .all()
         )
     else:
-        from sqlalchemy import text
-
         dead_ids = db.session.execute(
-            text("""
-                SELECT ip_id FROM (
-                    SELECT ip_id, download_speed_mbps,
-                        ROW_NUMBER() OVER (
-                            PARTITION BY ip_id ORDER BY test_time DESC
-                        ) AS rn
-                    FROM test_results
-                    WHERE ip_id IN (SELECT id FROM ips WHERE is_active = 1)
-                )
-                WHERE rn <= :last_n
-                GROUP BY ip_id
-                HAVING SUM(CASE WHEN download_speed_mbps > 0 THEN 1 ELSE 0 END) = 0
-            """),
+            _DEAD_IPS_BY_TESTS,
             {"last_n": value},
         ).fetchall()
 
@@ -1,5 +1,7 @@
+import ipaddress
 import os
 from pathlib import Path
+from types import MappingProxyType
 
 from dotenv import load_dotenv
 
@@ -18,6 +20,22 @@ def _env(key, default=None, cast=None):
     return value
 
 
+def _engine_options(uri, pool_size, max_overflow):
+    """SQLAlchemy engine options for ``uri``."""
+    if not uri.startswith("sqlite"):
+        return {}
+    # sqlite3 keeps prepared statements per connection keyed by SQL text;
+    # leave room for every statement the app issues (default is 128).
+    options = {"connect_args": {"cached_statements": 256}}
+    if uri.startswith("sqlite:///") and ":memory:" not in uri:
+        # At most pool_size + max_overflow open connections (and file
+        # descriptors); further threads wait for a free one. Keep some
+        # overflow: a thread may hold a read connection while it waits for
+        # the write lock, and the lock holder still needs one.
+        options.update(pool_size=pool_size, max_overflow=max_overflow)
+    return options
+
+
 def _env_list(key, default=""):
     """Read a comma-separated env var into a list."""
     raw = os.environ.get(key, default)
@@ -39,14 +57,28 @@ class Config:
         f"sqlite:///{BASE_DIR / 'data' / 'cloudflare_ips.db'}",
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    DB_POOL_SIZE = _env("DB_POOL_SIZE", 8, int)
+    DB_MAX_OVERFLOW = _env("DB_MAX_OVERFLOW", 16, int)
+    SQLALCHEMY_ENGINE_OPTIONS = _engine_options(
+        SQLALCHEMY_DATABASE_URI, DB_POOL_SIZE, DB_MAX_OVERFLOW
+    )
 
     # Scanner binary
     SCANNER_BINARY = Path(
         _env("SCANNER_BINARY", str(BASE_DIR / "scanner" / "CloudflareScanner"))
     )
+    # Expected SHA-256 of the release zip fetched when the binary is missing
+    SCANNER_SHA256 = _env("SCANNER_SHA256", "").strip().lower()
+    # Pipe IP lists to the scanner via /dev/stdin instead of a temp file
+    # (ignored on Windows, which has no /dev/stdin). Off by default: a
+    # binary that cannot read -f /dev/stdin silently returns empty scans.
+    SCANNER_STDIN = _env("SCANNER_STDIN", "false").lower() in ("true", "1", "yes")
+
+    # Parameter groups are read-only; callers that adjust values per run
+    # work on a .copy().
 
     # Initial scan parameters
-    INITIAL_SCAN = {
+    INITIAL_SCAN = MappingProxyType({
         "min_speed": _env("SCAN_MIN_SPEED", 10.0, float),
         "max_loss_rate": _env("SCAN_MAX_LOSS_RATE", 0.25, float),
         "max_latency": _env("SCAN_MAX_LATENCY", 1000, int),
@@ -62,15 +94,17 @@ class Config:
         "httping": _env("SCAN_HTTPING", "true").lower() in ("true", "1", "yes"),
         "httping_code": _env("SCAN_HTTPING_CODE", "200"),
         "schedule_interval": _env("SCAN_SCHEDULE_INTERVAL", 0, int),
-    }
+        "shards": _env("SCAN_SHARDS", 1, int),
+    })
 
     # Monitor parameters
-    MONITOR = {
+    MONITOR = MappingProxyType({
         "interval_seconds": _env("MONITOR_INTERVAL", 120, int),
         "download_timeout": _env("MONITOR_DOWNLOAD_TIMEOUT", 10, int),
         "ping_times": _env("MONITOR_PING_TIMES", 4, int),
         "threads": _env("MONITOR_THREADS", 100, int),
         "max_ips_per_cycle": _env("MONITOR_MAX_IPS", 20, int),
+        "parallel_batches": _env("MONITOR_PARALLEL_BATCHES", 1, int),
         "port": _env("MONITOR_PORT", 443, int),
         "url": _env(
             "MONITOR_URL",
@@ -78,13 +112,14 @@ class Config:
         ),
         "httping": _env("MONITOR_HTTPING", "true").lower() in ("true", "1", "yes"),
         "httping_code": _env("MONITOR_HTTPING_CODE", "200"),
-    }
+    })
 
     # Cleanup parameters
-    CLEANUP = {
+    CLEANUP = MappingProxyType({
         "enabled": _env("CLEANUP_ENABLED", "true").lower() in ("true", "1", "yes"),
         "no_speed_tests": _env("CLEANUP_NO_SPEED_TESTS", 10, int),
-    }
+        "interval_seconds": _env("CLEANUP_INTERVAL", 86400, int),
+    })
 
     # Dashboard
     DASHBOARD_HOST = _env("DASHBOARD_HOST", "0.0.0.0")
@@ -97,6 +132,8 @@ class Config:
 
     # Data retention
     RETENTION_DAYS = _env("RETENTION_DAYS", 30, int)
+    # Full VACUUM (defragment) every N days; 0 disables it
+    FULL_VACUUM_DAYS = _env("FULL_VACUUM_DAYS", 0, int)
 
     # Cloudflare IP ranges
     CLOUDFLARE_IPV4_RANGES = _env_list(
@@ -113,6 +150,15 @@ class Config:
         "2405:b500::/32,2405:8100::/32,2a06:98c0::/29,2c0f:f248::/32",
     )
 
+    # Parsed once at import: a malformed range fails at startup rather than
+    # mid-scan, and the scanner gets the normalized CIDRs without
+    # rebuilding the list on every run.
+    CLOUDFLARE_NETWORKS = tuple(
+        ipaddress.ip_network(cidr, strict=False)
+        for cidr in CLOUDFLARE_IPV4_RANGES + CLOUDFLARE_IPV6_RANGES
+    )
+    CLOUDFLARE_RANGES = tuple(str(net) for net in CLOUDFLARE_NETWORKS)
+
     # Logging
     LOG_FORMAT = _env(
         "LOG_FORMAT", "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
@@ -1,3 +1,29 @@
+import threading
+
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 
 db = SQLAlchemy()
+
+# SQLite allows one writer at a time. Writers in this process take this lock
+# around their write transaction, so they queue here instead of sleeping in
+# SQLite's busy handler. Reentrant, so one writer may call another.
+db_write_lock = threading.RLock()
+
+_commit_generation = 0
+
+
+@event.listens_for(Session, "after_commit")
+def _count_commit(session):
+    global _commit_generation
+    _commit_generation += 1
+
+
+def commit_generation():
+    """Number of session commits in this process so far.
+
+    Caches of query results compare it to tell whether anything this
+    process wrote may have changed them.
+    """
+    return _commit_generation
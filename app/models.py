@@ -1,5 +1,7 @@
 from datetime import datetime, timezone
 
+from sqlalchemy import DDL, event
+
 from app.extensions import db
 
 
@@ -8,9 +10,12 @@ class IP(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     ip_address = db.Column(db.String(45), unique=True, nullable=False, index=True)
+    # 4- or 16-byte binary form of ip_address; point lookups go through this
+    # index, which is far smaller than the text one.
+    ip_packed = db.Column(db.LargeBinary(16), unique=True, index=True)
     first_seen = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     last_tested = db.Column(db.DateTime)
-    is_active = db.Column(db.Boolean, default=True, index=True)
+    is_active = db.Column(db.Boolean, default=True)
     total_tests = db.Column(db.Integer, default=0)
     avg_latency = db.Column(db.Float)
     avg_download_speed = db.Column(db.Float)
@@ -20,6 +25,14 @@ class IP(db.Model):
     best_download_speed = db.Column(db.Float)
     worst_latency = db.Column(db.Float)
     worst_download_speed = db.Column(db.Float)
+    # Running non-NULL counts and sums behind the averages, maintained by
+    # the ips_stats_insert trigger.
+    latency_count = db.Column(db.Integer)
+    latency_sum = db.Column(db.Float)
+    speed_count = db.Column(db.Integer)
+    speed_sum = db.Column(db.Float)
+    loss_count = db.Column(db.Integer)
+    loss_sum = db.Column(db.Float)
     colo_code = db.Column(db.String(10))
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
 
@@ -48,6 +61,43 @@ class IP(db.Model):
         }
 
 
+# The columns IP.to_dict reads. Selecting these yields lightweight named
+# tuple rows instead of ORM objects, for read-only listings; serialize them
+# with ip_row_to_dict.
+IP_ROW_COLUMNS = tuple(
+    IP.__table__.c[name]
+    for name in (
+        "id",
+        "ip_address",
+        "first_seen",
+        "last_tested",
+        "is_active",
+        "total_tests",
+        "avg_latency",
+        "avg_download_speed",
+        "avg_upload_speed",
+        "avg_loss_rate",
+        "best_latency",
+        "best_download_speed",
+        "worst_latency",
+        "worst_download_speed",
+        "colo_code",
+        "created_at",
+    )
+)
+
+_IP_ROW_DATETIMES = ("first_seen", "last_tested", "created_at")
+
+
+def ip_row_to_dict(row):
+    """Serialize a row selected with IP_ROW_COLUMNS the way IP.to_dict does."""
+    data = row._asdict()
+    for name in _IP_ROW_DATETIMES:
+        if data[name]:
+            data[name] = data[name].isoformat()
+    return data
+
+
 class TestResult(db.Model):
     __tablename__ = "test_results"
 
@@ -56,11 +106,8 @@ class TestResult(db.Model):
         db.Integer,
         db.ForeignKey("ips.id", ondelete="CASCADE"),
         nullable=False,
-        index=True,
-    )
-    test_time = db.Column(
-        db.DateTime, default=lambda: datetime.now(timezone.utc), index=True
     )
+    test_time = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     latency_ms = db.Column(db.Float)
     download_speed_mbps = db.Column(db.Float)
     upload_speed_mbps = db.Column(db.Float)
@@ -86,6 +133,170 @@ class TestResult(db.Model):
         }
 
 
+# Active IPs fastest first (latency breaking ties), the order of every IP
+# listing; queries must filter with ``IP.is_active.is_(True)`` to match
+# the index condition.
+db.Index(
+    "ix_ips_active_speed",
+    IP.avg_download_speed.desc(),
+    IP.avg_latency,
+    sqlite_where=IP.is_active.is_(True),
+)
+
+# Covering index for time-range scans over test_results (retention cleanup,
+# the hourly rollup backfill): served from the index alone, without
+# touching the table rows.
+db.Index(
+    "ix_test_results_time_covering",
+    TestResult.test_time,
+    TestResult.ip_id,
+    TestResult.latency_ms,
+    TestResult.download_speed_mbps,
+    TestResult.loss_rate,
+)
+# Per-IP history, newest first; also serves every lookup by ip_id.
+db.Index("ix_test_results_ip_id_time", TestResult.ip_id, TestResult.test_time.desc())
+
+
+# Fold each new test result into its IP's aggregates in O(1): the running
+# counts and sums give the averages, MIN/MAX the extremes. Every assignment
+# sees the pre-update row, hence the repeated sums in the averages. Created
+# with IF NOT EXISTS on every create_all so existing databases get it too.
+event.listen(
+    db.metadata,
+    "after_create",
+    DDL(
+        """
+        CREATE TRIGGER IF NOT EXISTS ips_stats_insert
+        AFTER INSERT ON test_results
+        BEGIN
+            UPDATE ips SET
+                total_tests = COALESCE(total_tests, 0) + 1,
+                last_tested = NEW.test_time,
+                latency_count = COALESCE(latency_count, 0)
+                    + (NEW.latency_ms IS NOT NULL),
+                latency_sum = COALESCE(latency_sum, 0)
+                    + COALESCE(NEW.latency_ms, 0),
+                speed_count = COALESCE(speed_count, 0)
+                    + (NEW.download_speed_mbps IS NOT NULL),
+                speed_sum = COALESCE(speed_sum, 0)
+                    + COALESCE(NEW.download_speed_mbps, 0),
+                loss_count = COALESCE(loss_count, 0) + (NEW.loss_rate IS NOT NULL),
+                loss_sum = COALESCE(loss_sum, 0) + COALESCE(NEW.loss_rate, 0),
+                avg_latency = (COALESCE(latency_sum, 0) + COALESCE(NEW.latency_ms, 0))
+                    / NULLIF(COALESCE(latency_count, 0)
+                             + (NEW.latency_ms IS NOT NULL), 0),
+                avg_download_speed = (
+                    COALESCE(speed_sum, 0) + COALESCE(NEW.download_speed_mbps, 0)
+                ) / NULLIF(COALESCE(speed_count, 0)
+                           + (NEW.download_speed_mbps IS NOT NULL), 0),
+                avg_loss_rate = (COALESCE(loss_sum, 0) + COALESCE(NEW.loss_rate, 0))
+                    / NULLIF(COALESCE(loss_count, 0)
+                             + (NEW.loss_rate IS NOT NULL), 0),
+                best_latency = COALESCE(
+                    MIN(best_latency, NEW.latency_ms), best_latency, NEW.latency_ms
+                ),
+                best_download_speed = COALESCE(
+                    MAX(best_download_speed, NEW.download_speed_mbps),
+                    best_download_speed, NEW.download_speed_mbps
+                ),
+                worst_latency = COALESCE(
+                    MAX(worst_latency, NEW.latency_ms), worst_latency, NEW.latency_ms
+                ),
+                worst_download_speed = COALESCE(
+                    MIN(worst_download_speed, NEW.download_speed_mbps),
+                    worst_download_speed, NEW.download_speed_mbps
+                )
+            WHERE id = NEW.ip_id;
+        END
+        """
+    ),
+)
+
+
+class TestResultHourly(db.Model):
+    """Per-hour totals of test_results, kept in step by triggers.
+
+    Counts are kept per metric so averages skip NULLs the way AVG() does.
+    """
+
+    __tablename__ = "test_results_hourly"
+
+    hour = db.Column(db.String(16), primary_key=True)
+    test_count = db.Column(db.Integer, nullable=False, default=0)
+    latency_count = db.Column(db.Integer, nullable=False, default=0)
+    latency_sum = db.Column(db.Float, nullable=False, default=0)
+    speed_count = db.Column(db.Integer, nullable=False, default=0)
+    speed_sum = db.Column(db.Float, nullable=False, default=0)
+    loss_count = db.Column(db.Integer, nullable=False, default=0)
+    loss_sum = db.Column(db.Float, nullable=False, default=0)
+
+
+# The triggers and the backfill reference test_results, so create it first.
+TestResultHourly.__table__.add_is_dependent_on(TestResult.__table__)
+
+# Created with the rollup table, so an existing database gets the triggers
+# and its current history rolled up the first time it is opened.
+for _ddl in (
+    """
+    CREATE TRIGGER test_results_hourly_insert AFTER INSERT ON test_results
+    WHEN NEW.test_time IS NOT NULL
+    BEGIN
+        INSERT INTO test_results_hourly (
+            hour, test_count, latency_count, latency_sum,
+            speed_count, speed_sum, loss_count, loss_sum
+        ) VALUES (
+            strftime('%%Y-%%m-%%d %%H:00', NEW.test_time), 1,
+            NEW.latency_ms IS NOT NULL, COALESCE(NEW.latency_ms, 0),
+            NEW.download_speed_mbps IS NOT NULL,
+            COALESCE(NEW.download_speed_mbps, 0),
+            NEW.loss_rate IS NOT NULL, COALESCE(NEW.loss_rate, 0)
+        )
+        ON CONFLICT (hour) DO UPDATE SET
+            test_count = test_count + 1,
+            latency_count = latency_count + excluded.latency_count,
+            latency_sum = latency_sum + excluded.latency_sum,
+            speed_count = speed_count + excluded.speed_count,
+            speed_sum = speed_sum + excluded.speed_sum,
+            loss_count = loss_count + excluded.loss_count,
+            loss_sum = loss_sum + excluded.loss_sum;
+    END
+    """,
+    """
+    CREATE TRIGGER test_results_hourly_delete AFTER DELETE ON test_results
+    WHEN OLD.test_time IS NOT NULL
+    BEGIN
+        UPDATE test_results_hourly SET
+            test_count = test_count - 1,
+            latency_count = latency_count - (OLD.latency_ms IS NOT NULL),
+            latency_sum = latency_sum - COALESCE(OLD.latency_ms, 0),
+            speed_count = speed_count - (OLD.download_speed_mbps IS NOT NULL),
+            speed_sum = speed_sum - COALESCE(OLD.download_speed_mbps, 0),
+            loss_count = loss_count - (OLD.loss_rate IS NOT NULL),
+            loss_sum = loss_sum - COALESCE(OLD.loss_rate, 0)
+        WHERE hour = strftime('%%Y-%%m-%%d %%H:00', OLD.test_time);
+        DELETE FROM test_results_hourly
+        WHERE hour = strftime('%%Y-%%m-%%d %%H:00', OLD.test_time)
+          AND test_count <= 0;
+    END
+    """,
+    """
+    INSERT INTO test_results_hourly (
+        hour, test_count, latency_count, latency_sum,
+        speed_count, speed_sum, loss_count, loss_sum
+    )
+    SELECT strftime('%%Y-%%m-%%d %%H:00', test_time), COUNT(*),
+           COUNT(latency_ms), TOTAL(latency_ms),
+           COUNT(download_speed_mbps), TOTAL(download_speed_mbps),
+           COUNT(loss_rate), TOTAL(loss_rate)
+    FROM test_results
+    WHERE test_time IS NOT NULL
+    GROUP BY 1
+    """,
+):
+    event.listen(TestResultHourly.__table__, "after_create", DDL(_ddl))
+
+
 class ScanSession(db.Model):
     __tablename__ = "scan_sessions"
 
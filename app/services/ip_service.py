@@ -1,115 +1,289 @@
+import functools
+import ipaddress
 import logging
-from datetime import datetime, timezone
 
-from sqlalchemy import func, text
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
-from app.extensions import db
-from app.models import IP, TestResult, ScanSession
+from app.extensions import db, db_write_lock
+from app.models import IP, IP_ROW_COLUMNS, TestResult, ScanSession
 
 logger = logging.getLogger(__name__)
 
+# Rebuild IP aggregates from the retained test history. IPs whose results
+# have all been deleted get zero counts and sums and NULL averages and
+# extremes, so the next result starts them afresh. With :missing_only,
+# only IPs predating the running sums that have any history are touched.
+# total_tests stays cumulative. New results are folded in by the
+# ips_stats_insert trigger instead.
+_RECOMPUTE_IP_STATS = text("""
+    UPDATE ips SET
+        (latency_count, latency_sum, speed_count, speed_sum,
+         loss_count, loss_sum,
+         avg_latency, avg_download_speed, avg_loss_rate,
+         best_latency, best_download_speed,
+         worst_latency, worst_download_speed) = (
+            SELECT COUNT(latency_ms), TOTAL(latency_ms),
+                   COUNT(download_speed_mbps), TOTAL(download_speed_mbps),
+                   COUNT(loss_rate), TOTAL(loss_rate),
+                   AVG(latency_ms), AVG(download_speed_mbps), AVG(loss_rate),
+                   MIN(latency_ms), MAX(download_speed_mbps),
+                   MAX(latency_ms), MIN(download_speed_mbps)
+            FROM test_results WHERE ip_id = ips.id
+        )
+    WHERE NOT :missing_only
+       OR (latency_count IS NULL
+           AND EXISTS (SELECT 1 FROM test_results WHERE ip_id = ips.id))
+""")
 
-def add_test_result(
-    ip_address,
-    latency_ms,
-    download_speed,
-    loss_rate,
-    packets_sent=4,
-    packets_received=4,
-    upload_speed=None,
-    colo_code=None,
-    test_type="periodic",
-):
-    """Add a test result and update IP aggregate statistics."""
-    ip = IP.query.filter_by(ip_address=ip_address).first()
-    if not ip:
-        ip = IP(ip_address=ip_address, colo_code=colo_code)
-        db.session.add(ip)
-        db.session.flush()
-    elif colo_code:
-        ip.colo_code = colo_code
-        ip.last_tested = datetime.now(timezone.utc)
-
-    result = TestResult(
-        ip_id=ip.id,
-        latency_ms=latency_ms,
-        download_speed_mbps=download_speed,
-        upload_speed_mbps=upload_speed,
-        loss_rate=loss_rate,
-        packets_sent=packets_sent,
-        packets_received=packets_received,
-        colo_code=colo_code,
-        test_type=test_type,
+# Active IPs with at least :last_n tests, none of the last :last_n of which
+# had any download speed.
+_DEAD_IPS = text("""
+    SELECT ip_id FROM (
+        SELECT ip_id, download_speed_mbps,
+            ROW_NUMBER() OVER (
+                PARTITION BY ip_id ORDER BY test_time DESC
+            ) AS rn
+        FROM test_results
+        WHERE ip_id IN (SELECT id FROM ips WHERE is_active IS 1)
     )
-    db.session.add(result)
-    db.session.flush()
-
-    # Update IP aggregate statistics
-    stats = db.session.query(
-        func.avg(TestResult.latency_ms),
-        func.avg(TestResult.download_speed_mbps),
-        func.avg(TestResult.loss_rate),
-        func.min(TestResult.latency_ms),
-        func.max(TestResult.download_speed_mbps),
-        func.max(TestResult.latency_ms),
-        func.min(TestResult.download_speed_mbps),
-    ).filter(TestResult.ip_id == ip.id).first()
-
-    ip.avg_latency = stats[0]
-    ip.avg_download_speed = stats[1]
-    ip.avg_loss_rate = stats[2]
-    ip.best_latency = stats[3]
-    ip.best_download_speed = stats[4]
-    ip.worst_latency = stats[5]
-    ip.worst_download_speed = stats[6]
-    ip.total_tests = (ip.total_tests or 0) + 1
-    ip.last_tested = datetime.now(timezone.utc)
+    WHERE rn <= :last_n
+    GROUP BY ip_id
+    HAVING COUNT(*) >= :last_n
+       AND SUM(CASE WHEN download_speed_mbps > 0 THEN 1 ELSE 0 END) = 0
+""")
 
-    db.session.commit()
-    return result.id
+# Insert an IP or, if it already exists, keep the row and only refresh a
+# newly reported colo code: one statement and one index probe either way.
+_UPSERT_IP = sqlite_insert(IP)
+_UPSERT_IP = _UPSERT_IP.on_conflict_do_update(
+    index_elements=[IP.ip_address],
+    set_={"colo_code": func.coalesce(_UPSERT_IP.excluded.colo_code, IP.colo_code)},
+)
+
+_OLD_RESULTS_CUTOFF = text("datetime('now', :offset)")
+
+
+def _serialized(fn):
+    """Run a write function under ``db_write_lock``."""
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with db_write_lock:
+            return fn(*args, **kwargs)
+
+    return wrapper
+
+
+def pack_ip(address):
+    """Return the binary form of ``address``, or None if it is not an IP."""
+    try:
+        return ipaddress.ip_address(address).packed
+    except ValueError:
+        return None
+
+
+def normalize_ip(address):
+    """Return ``(canonical_address, packed)`` for ``address``.
+
+    Every spelling of an IP maps to the same pair, so rows stay unique on
+    both ``ip_address`` and ``ip_packed``.  Addresses that do not parse
+    come back unchanged, with None.
+    """
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return address, None
+    return str(ip), ip.packed
+
+
+def get_ip(address):
+    """Look up an IP row by address through the packed-address index."""
+    packed = pack_ip(address)
+    if packed is None:
+        return None
+    return IP.query.filter_by(ip_packed=packed).first()
+
+
+@_serialized
+def add_test_results_bulk(results, test_type="periodic", commit=True, ip_ids=None):
+    """Add many scan results in one transaction.
+
+    ``results`` holds scan results as produced by the scanner (objects
+    with ``ip_address``, ``latency_ms``, ``download_speed``, ``loss_rate``,
+    ``packets_sent``, ``packets_received`` and ``colo_code``).  All rows
+    are inserted with a single executemany; IP aggregates follow via
+    trigger.  Returns the number of rows added.
+
+    ``ip_ids`` optionally maps addresses to known IP ids (e.g. from
+    ``iter_active_ip_addresses``); those IPs skip the upsert unless a result carries
+    a colo code to record.
+    """
+    if not results:
+        return 0
+
+    # ip_ids is only read: it may be the caller's whole active-IP map.
+    known_ids = ip_ids or {}
+    colo_codes = {}
+    for r in results:
+        if r.ip_address in known_ids and not r.colo_code:
+            continue
+        if r.colo_code or r.ip_address not in colo_codes:
+            colo_codes[r.ip_address] = r.colo_code
+    # Ids of the IPs upserted here, looked up before known_ids. Rows are
+    # stored under the canonical spelling, one row per IP however the
+    # results spelled it.
+    upserted_ids = {}
+    if colo_codes:
+        canonical = {}
+        rows = {}
+        for address, colo_code in colo_codes.items():
+            ip_address, ip_packed = normalize_ip(address)
+            canonical[address] = ip_address
+            row = rows.get(ip_address)
+            if row is None or (colo_code and not row["colo_code"]):
+                rows[ip_address] = {
+                    "ip_address": ip_address,
+                    "ip_packed": ip_packed,
+                    "colo_code": colo_code,
+                }
+        ids = dict(
+            db.session.execute(
+                _UPSERT_IP.returning(IP.ip_address, IP.id), list(rows.values())
+            ).all()
+        )
+        upserted_ids = {address: ids[c] for address, c in canonical.items()}
+
+    db.session.execute(
+        insert(TestResult),
+        [
+            {
+                "ip_id": upserted_ids.get(r.ip_address) or known_ids[r.ip_address],
+                "latency_ms": r.latency_ms,
+                "download_speed_mbps": r.download_speed,
+                "loss_rate": r.loss_rate,
+                "packets_sent": r.packets_sent,
+                "packets_received": r.packets_received,
+                "colo_code": r.colo_code,
+                "test_type": test_type,
+            }
+            for r in results
+        ],
+    )
+    if commit:
+        db.session.commit()
+    return len(results)
 
 
+@_serialized
 def add_scan_session(total_tested, passed, min_speed, max_latency, max_loss, duration):
     """Record a completed scan session."""
-    session = ScanSession(
-        total_ips_tested=total_tested,
-        ips_passed=passed,
-        min_speed_threshold=min_speed,
-        max_latency_threshold=max_latency,
-        max_loss_threshold=max_loss,
-        scan_duration_seconds=duration,
-    )
-    db.session.add(session)
+    session_id = db.session.execute(
+        insert(ScanSession).returning(ScanSession.id),
+        {
+            "total_ips_tested": total_tested,
+            "ips_passed": passed,
+            "min_speed_threshold": min_speed,
+            "max_latency_threshold": max_latency,
+            "max_loss_threshold": max_loss,
+            "scan_duration_seconds": duration,
+        },
+    ).scalar_one()
     db.session.commit()
-    return session.id
+    return session_id
+
+
+def iter_active_ips(limit=None):
+    """Yield active IPs ordered by speed then latency.
+
+    Yields read-only rows (named tuples with the IP column names, which
+    ``ip_row_to_dict`` serializes) rather than ORM objects.  Rows are fetched
+    in batches as the caller consumes them, so nothing beyond the current
+    batch is held in memory.
+    """
+    query = (
+        select(*IP_ROW_COLUMNS)
+        .where(IP.is_active.is_(True))
+        .order_by(IP.avg_download_speed.desc(), IP.avg_latency.asc())
+        # Always bind a LIMIT (-1 means unbounded in SQLite) so every call
+        # shares one SQL text and one prepared statement.
+        .limit(limit or -1)
+    )
+    yield from db.session.execute(query.execution_options(yield_per=500))
+
 
+def iter_active_ip_addresses(limit=None):
+    """Yield ``(ip_address, id)`` rows for active IPs, in the same order.
 
-def get_active_ips(limit=None):
-    """Get active IPs ordered by speed then latency."""
+    For callers that only need to address the IPs, without loading their
+    statistics.
+    """
     query = (
-        IP.query.filter_by(is_active=True)
+        select(IP.ip_address, IP.id)
+        .where(IP.is_active.is_(True))
         .order_by(IP.avg_download_speed.desc(), IP.avg_latency.asc())
+        .limit(limit or -1)
     )
-    if limit:
-        query = query.limit(limit)
-    return [ip.to_dict() for ip in query.all()]
+    yield from db.session.execute(query.execution_options(yield_per=500))
 
 
-def cleanup_old_data(retention_days):
-    """Remove test results older than retention period."""
-    cutoff = text(f"datetime('now', '-{int(retention_days)} days')")
+def recompute_ip_stats(missing_only=False):
+    """Rebuild IP aggregates from the retained test history.
+
+    Needed after old results are deleted, and once for IPs recorded before
+    the running sums existed (``missing_only=True``).  Does not commit.
+    """
+    db.session.execute(_RECOMPUTE_IP_STATS, {"missing_only": missing_only})
+
+
+def _reclaim_free_pages(full=False):
+    """Return pages freed by deletes to the filesystem.
+
+    Databases in ``auto_vacuum=INCREMENTAL`` mode only release the pages on
+    the freelist.  Anything else, or ``full=True``, gets a full VACUUM,
+    which rewrites the file and converts older databases to incremental
+    mode on the way.
+    """
+    conn = db.engine.raw_connection()
+    try:
+        incremental = conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+        # executescript steps the pragma to completion; a plain execute
+        # stops after the first page.
+        if incremental and not full:
+            conn.executescript("PRAGMA incremental_vacuum")
+        else:
+            conn.executescript("VACUUM")
+    finally:
+        conn.close()
+
+
+@_serialized
+def cleanup_old_data(retention_days, full_vacuum=False):
+    """Remove test results older than retention period.
+
+    Freed pages are reclaimed incrementally; pass ``full_vacuum=True`` to
+    also defragment the whole file.
+    """
+    cutoff = _OLD_RESULTS_CUTOFF.bindparams(offset=f"-{int(retention_days)} days")
     deleted = TestResult.query.filter(TestResult.test_time < cutoff).delete(
         synchronize_session=False
     )
+    if deleted > 0:
+        recompute_ip_stats()
     db.session.commit()
 
+    if deleted > 0 or full_vacuum:
+        _reclaim_free_pages(full=full_vacuum)
     if deleted > 0:
-        db.session.execute(text("VACUUM"))
+        # Retention deletes shift the row distribution; let SQLite decide
+        # whether the planner statistics need refreshing.
+        db.session.execute(text("PRAGMA optimize"))
         logger.info(f"Cleaned up {deleted} old test records")
 
     return deleted
 
 
+@_serialized
 def cleanup_dead_ips(no_speed_tests=10):
     """Deactivate IPs that have had no download speed for the last N tests.
 
@@ -119,20 +293,7 @@ def cleanup_dead_ips(no_speed_tests=10):
     ``no_speed_tests`` results are left untouched.
     """
     dead_ids = db.session.execute(
-        text("""
-            SELECT ip_id FROM (
-                SELECT ip_id, download_speed_mbps,
-                    ROW_NUMBER() OVER (
-                        PARTITION BY ip_id ORDER BY test_time DESC
-                    ) AS rn
-                FROM test_results
-                WHERE ip_id IN (SELECT id FROM ips WHERE is_active = 1)
-            )
-            WHERE rn <= :last_n
-            GROUP BY ip_id
-            HAVING COUNT(*) >= :last_n
-               AND SUM(CASE WHEN download_speed_mbps > 0 THEN 1 ELSE 0 END) = 0
-        """),
+        _DEAD_IPS,
         {"last_n": no_speed_tests},
     ).fetchall()
 
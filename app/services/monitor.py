@@ -1,11 +1,16 @@
 import logging
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Callable, List, Optional
 
 from app.config import Config
-from app.services.ip_service import cleanup_dead_ips, cleanup_old_data, get_active_ips
+from app.services.ip_service import (
+    cleanup_dead_ips,
+    cleanup_old_data,
+    iter_active_ip_addresses,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -18,58 +23,77 @@ class PeriodicMonitor:
         self._thread: Optional[threading.Thread] = None
         self._is_running = False
         self._last_test_time: Optional[datetime] = None
+        # Monotonic twin of _last_test_time for countdowns; the datetime is
+        # only kept for display.
+        self._last_test_mono: Optional[float] = None
         self._test_count = 0
+        self._last_full_vacuum = time.time()
         self._callbacks: List[Callable] = []
 
     def add_callback(self, callback: Callable):
         self._callbacks.append(callback)
 
     def _notify_callbacks(self, results):
-        for cb in self._callbacks:
+        callbacks = self._callbacks
+        for cb in callbacks:
             try:
                 cb(results)
-            except Exception as e:
-                logger.error(f"Callback error: {e}")
+            except Exception:
+                logger.exception("Callback error")
 
     def _test_cycle(self):
         logger.info("Starting periodic test cycle...")
         try:
+            # Known ids let the results skip the per-IP lookup on save.
             with self.app.app_context():
-                active_ips = get_active_ips()
+                ip_ids = dict(iter_active_ip_addresses())
 
-            if not active_ips:
+            if not ip_ids:
                 logger.warning("No active IPs to test. Run initial scan first.")
                 return []
 
-            all_ip_list = [ip["ip_address"] for ip in active_ips]
+            all_ip_list = list(ip_ids)
             batch_size = Config.MONITOR["max_ips_per_cycle"]
             total = len(all_ip_list)
+            batches = [
+                all_ip_list[i : i + batch_size] for i in range(0, total, batch_size)
+            ]
+            total_batches = len(batches)
+            # Up to parallel_batches scanner processes at once, sharing the
+            # thread budget so the total stays the same as one at a time.
+            workers = max(1, min(Config.MONITOR["parallel_batches"], total_batches))
+            threads = max(1, Config.MONITOR["threads"] // workers)
             logger.info(
-                f"Testing all {total} active IPs in batches of {batch_size}..."
+                f"Testing all {total} active IPs in batches of {batch_size} "
+                f"({workers} at a time)..."
             )
 
-            all_results = []
-            for i in range(0, total, batch_size):
-                batch = all_ip_list[i : i + batch_size]
-                batch_num = (i // batch_size) + 1
-                total_batches = (total + batch_size - 1) // batch_size
+            def run_batch(batch_num, batch):
+                if self._stop_event.is_set():
+                    return []
                 logger.info(
                     f"Testing batch {batch_num}/{total_batches} "
                     f"({len(batch)} IPs)..."
                 )
-
-                results = self.app.scanner.test_specific_ips(
+                return self.app.scanner.test_specific_ips(
                     ip_addresses=batch,
                     timeout=Config.MONITOR["download_timeout"],
-                    threads=Config.MONITOR["threads"],
+                    threads=threads,
+                    ip_ids=ip_ids,
                 )
-                all_results.extend(results)
 
-                if self._stop_event.is_set():
-                    logger.info("Monitor stop requested, aborting remaining batches")
-                    break
+            all_results = []
+            with ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="monitor-batch"
+            ) as pool:
+                for results in pool.map(run_batch, range(1, total_batches + 1), batches):
+                    all_results.extend(results)
+
+            if self._stop_event.is_set():
+                logger.info("Monitor stop requested, remaining batches skipped")
 
             self._last_test_time = datetime.now()
+            self._last_test_mono = time.monotonic()
             self._test_count += 1
             logger.info(
                 f"Test cycle completed: {len(all_results)} results "
@@ -79,28 +103,43 @@ class PeriodicMonitor:
             self._notify_callbacks(all_results)
             return all_results
 
-        except Exception as e:
-            logger.error(f"Test cycle failed: {e}")
+        except Exception:
+            logger.exception("Test cycle failed")
             return []
 
     def _cleanup_cycle(self):
         try:
+            full_vacuum = bool(Config.FULL_VACUUM_DAYS) and (
+                time.time() - self._last_full_vacuum
+                >= Config.FULL_VACUUM_DAYS * 86400
+            )
             with self.app.app_context():
-                cleanup_old_data(Config.RETENTION_DAYS)
+                cleanup_old_data(Config.RETENTION_DAYS, full_vacuum=full_vacuum)
+                if full_vacuum:
+                    self._last_full_vacuum = time.time()
                 if Config.CLEANUP["enabled"]:
                     cleanup_dead_ips(Config.CLEANUP["no_speed_tests"])
-        except Exception as e:
-            logger.error(f"Cleanup failed: {e}")
-
-    def _monitor_loop(self):
-        cleanup_counter = 0
-        while not self._stop_event.is_set():
+        except Exception:
+            logger.exception("Cleanup failed")
+
+    def _monitor_loop(self, first_delay=0):
+        # Cycles start on fixed deadlines one interval apart, so the period
+        # does not stretch by however long each cycle took.  A cycle that
+        # overruns its slot is followed straight away by the next one.
+        # Cleanup runs on its own clock, independent of the test interval.
+        # It is due after the first cycle, so a monitor that is restarted
+        # more often than the cleanup interval still cleans up.
+        cleanup_interval = Config.CLEANUP["interval_seconds"]
+        deadline = time.monotonic() + first_delay
+        next_cleanup = time.monotonic()
+        while not self._stop_event.wait(max(0, deadline - time.monotonic())):
             self._test_cycle()
-            cleanup_counter += 1
-            if cleanup_counter >= 24:
+            if time.monotonic() >= next_cleanup:
                 self._cleanup_cycle()
-                cleanup_counter = 0
-            self._stop_event.wait(self.interval)
+                next_cleanup = max(
+                    next_cleanup + cleanup_interval, time.monotonic()
+                )
+            deadline = max(deadline + self.interval, time.monotonic())
 
     def start(self, run_immediately=True):
         if self._is_running:
@@ -113,7 +152,11 @@ class PeriodicMonitor:
         if run_immediately:
             self._test_cycle()
 
-        self._thread = threading.Thread(target=self._monitor_loop, daemon=True)
+        # A cycle just ran, so the loop's first one is due an interval later.
+        first_delay = self.interval if run_immediately else 0
+        self._thread = threading.Thread(
+            target=self._monitor_loop, args=(first_delay,), daemon=True
+        )
         self._thread.start()
         logger.info(f"Periodic monitor started (interval: {self.interval}s)")
 
@@ -147,9 +190,9 @@ class PeriodicMonitor:
         }
 
     def _calculate_next_test(self) -> Optional[int]:
-        if not self._is_running or not self._last_test_time:
+        if not self._is_running or self._last_test_mono is None:
             return None
-        elapsed = (datetime.now() - self._last_test_time).total_seconds()
+        elapsed = time.monotonic() - self._last_test_mono
         return max(0, int(self.interval - elapsed))
 
     def set_interval(self, seconds: int):
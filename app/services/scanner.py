@@ -1,3 +1,6 @@
+import csv
+import functools
+import hashlib
 import logging
 import os
 import platform
@@ -9,13 +12,17 @@ import time
 import urllib.request
 import uuid
 import zipfile
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from flask import has_app_context
 
 from app.config import Config
-from app.services.ip_service import add_scan_session, add_test_result
+from app.extensions import db, db_write_lock
+from app.services.ip_service import add_scan_session, add_test_results_bulk
 
 logger = logging.getLogger(__name__)
 
@@ -24,13 +31,42 @@ RELEASES_URL = (
     "releases/download/v2.2.5"
 )
 
+# SHA-256 of each platform's release zip at RELEASES_URL, keyed by
+# _get_platform_suffix(); update together with RELEASES_URL. A download
+# is only extracted if its digest matches this entry (or SCANNER_SHA256,
+# which takes precedence); platforms without one are refused.
+RELEASE_SHA256: Dict[str, str] = {}
+
+# Read size for streaming the release download to disk.
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+
+# Path handed to the scanner's ``-f`` flag when the IP list is piped in.
+STDIN_PATH = "/dev/stdin"
+
+# Scanner output lines kept (and logged) per stream.
+OUTPUT_LOG_LINES = 50
+
+
+# Write buffer for IP list files: typical lists go out in a single write.
+IP_FILE_BUFFER_SIZE = 1 << 20
+
+
+def _write_ip_file(path, lines):
+    """Write ``lines`` to ``path`` without joining them in memory first.
+
+    Encoding the whole list up front for one ``os.write`` would hold both
+    the joined text and its bytes; the large buffer keeps typical lists to
+    a single write without either.
+    """
+    with open(path, "w", buffering=IP_FILE_BUFFER_SIZE, newline="\n") as f:
+        f.writelines(lines)
+
 
 class ScanCancelled(Exception):
     pass
 
 
-@dataclass
-class ScanResult:
+class ScanResult(NamedTuple):
     ip_address: str
     packets_sent: int
     packets_received: int
@@ -45,11 +81,13 @@ class CloudflareScanner:
         self.app = app
         self.binary_path = Config.SCANNER_BINARY
 
-        # Scan lock & cancellation
-        self._lock = threading.Lock()
-        self._process: Optional[subprocess.Popen] = None
+        # Scan flag & cancellation
+        self._scan_in_progress = threading.Event()
+        self._state_lock = threading.Lock()
+        self._processes: Set[subprocess.Popen] = set()
         self._cancel_event = threading.Event()
-        self._is_scanning = False
+        self._stdin_input = Config.SCANNER_STDIN and os.name != "nt"
+        self._cmd_templates: Dict[tuple, List[str]] = {}
         self._scan_start_time: Optional[float] = None
         self._last_scan_result: Optional[dict] = None
 
@@ -60,6 +98,7 @@ class CloudflareScanner:
         self._schedule_running = False
         self._schedule_last_run: Optional[str] = None
         self._schedule_scan_count = 0
+        self._buf_idx = 0
 
         logger.info(f"Initializing CloudflareScanner (binary: {self.binary_path})")
         self._ensure_binary()
@@ -67,7 +106,9 @@ class CloudflareScanner:
 
     # ── Binary management ────────────────────────────────────────
 
-    def _get_platform_suffix(self) -> str:
+    @staticmethod
+    @functools.lru_cache(maxsize=1)
+    def _get_platform_suffix() -> str:
         system = platform.system().lower()
         machine = platform.machine().lower()
 
@@ -101,18 +142,43 @@ class CloudflareScanner:
             logger.info("CloudflareScanner binary not found, downloading...")
             self._download_binary()
         if os.name != "nt":
-            st = os.stat(self.binary_path)
-            os.chmod(self.binary_path, st.st_mode | stat.S_IEXEC)
+            mode = os.stat(self.binary_path).st_mode
+            if not mode & stat.S_IEXEC:
+                os.chmod(self.binary_path, mode | stat.S_IEXEC)
 
     def _download_binary(self):
         suffix = self._get_platform_suffix()
         filename = f"CloudflareScanner_{suffix}.zip"
         url = f"{RELEASES_URL}/{filename}"
         zip_path = Config.SCANNER_DIR / filename
+        # Downloaded under a temporary name and only renamed once complete
+        # and verified, so an interrupted download is never extracted.
+        part_path = zip_path.with_name(filename + ".part")
+        expected = Config.SCANNER_SHA256 or RELEASE_SHA256.get(suffix)
 
         logger.info(f"Downloading {url}...")
         try:
-            urllib.request.urlretrieve(url, zip_path)
+            digest = hashlib.sha256()
+            with urllib.request.urlopen(url, timeout=60) as resp, open(
+                part_path, "wb"
+            ) as f:
+                for chunk in iter(lambda: resp.read(DOWNLOAD_CHUNK_SIZE), b""):
+                    digest.update(chunk)
+                    f.write(chunk)
+            sha256 = digest.hexdigest()
+            if not expected:
+                raise ValueError(
+                    f"No pinned SHA-256 for {filename} (got {sha256}); set "
+                    f"SCANNER_SHA256 once the release is verified"
+                )
+            if sha256 != expected:
+                raise ValueError(
+                    f"SHA-256 mismatch for {filename}: expected "
+                    f"{expected}, got {sha256}"
+                )
+            logger.info(f"Downloaded {filename} (sha256 {sha256})")
+            part_path.replace(zip_path)
+
             with zipfile.ZipFile(zip_path, "r") as zf:
                 zf.extractall(Config.SCANNER_DIR)
             zip_path.unlink()
@@ -126,17 +192,45 @@ class CloudflareScanner:
             logger.info("CloudflareScanner binary downloaded successfully")
         except Exception as e:
             logger.error(f"Failed to download CloudflareScanner: {e}")
+            part_path.unlink(missing_ok=True)
+            zip_path.unlink(missing_ok=True)
             raise RuntimeError(
                 f"Failed to download CloudflareScanner. Please download manually "
                 f"from {RELEASES_URL} and place in {Config.SCANNER_DIR}"
-            )
+            ) from e
 
     # ── Thread-safe helpers ──────────────────────────────────────
 
+    @property
+    def _is_scanning(self) -> bool:
+        return self._scan_in_progress.is_set()
+
+    def _try_begin_scan(self) -> bool:
+        """Claim the scan flag if it is free.
+
+        The lock only guards the check-and-set itself, so a caller never
+        waits on a scan that is already running.
+        """
+        with self._state_lock:
+            if self._scan_in_progress.is_set():
+                return False
+            self._scan_in_progress.set()
+            return True
+
+    def _app_context(self):
+        """Push an app context unless the caller already has one."""
+        if has_app_context():
+            return nullcontext()
+        return self.app.app_context()
+
     @staticmethod
-    def _temp_files(prefix: str) -> Tuple[Path, Path, Path]:
-        """Create unique file paths and working directory so concurrent runs never collide."""
-        uid = uuid.uuid4().hex[:8]
+    def _temp_files(prefix: str, tag: Optional[str] = None) -> Tuple[Path, Path, Path]:
+        """Create unique file paths and working directory so concurrent runs never collide.
+
+        Passing ``tag`` yields fixed paths instead, for callers that reuse
+        the same files across runs (see ``_cleanup(truncate=True)``).
+        """
+        uid = tag or uuid.uuid4().hex[:8]
         ip_file = Config.DATA_DIR / f"{prefix}_ips_{uid}.txt"
         result_file = Config.DATA_DIR / f"{prefix}_result_{uid}.csv"
         work_dir = Config.DATA_DIR / f"{prefix}_work_{uid}"
@@ -144,32 +238,44 @@ class CloudflareScanner:
         return ip_file, result_file, work_dir
 
     @staticmethod
-    def _cleanup(*paths: Path):
+    def _cleanup(*paths: Path, truncate: bool = False):
         for p in paths:
             try:
                 if p.is_dir():
-                    shutil.rmtree(p, ignore_errors=True)
+                    if not truncate:
+                        shutil.rmtree(p, ignore_errors=True)
+                elif truncate:
+                    if p.exists():
+                        p.write_bytes(b"")
                 else:
                     p.unlink(missing_ok=True)
             except OSError:
                 pass
 
-    def _run_process(self, cmd, timeout=3600, cwd=None):
+    def _run_process(self, cmd, timeout=3600, cwd=None, input_data=None):
         """Run the scanner binary with cancellation and timeout support.
 
         Uses Popen so the process can be terminated mid-flight via
-        ``cancel_scan()``.  Stdout/stderr are drained in background
-        threads to prevent pipe-buffer deadlocks.
+        ``cancel_scan()``.  Stderr (and stdout, when debug logging is on)
+        is drained in background threads to prevent pipe-buffer
+        deadlocks; only the lines that get logged are kept.  Safe to call
+        from several threads at once (one per scan shard).  ``input_data``
+        (bytes), if given, is fed to the process on stdin.
         """
-        self._cancel_event.clear()
         logger.debug(f"Launching process: {' '.join(str(c) for c in cmd)}")
-        self._process = subprocess.Popen(
+        # Stdout is only ever logged at debug level; otherwise discard it
+        # rather than reading it into memory.
+        capture_stdout = logger.isEnabledFor(logging.DEBUG)
+        process = subprocess.Popen(
             cmd,
-            stdout=subprocess.PIPE,
+            stdin=subprocess.PIPE if input_data is not None else None,
+            stdout=subprocess.PIPE if capture_stdout else subprocess.DEVNULL,
             stderr=subprocess.PIPE,
             cwd=str(cwd or Config.SCANNER_DIR),
         )
-        logger.debug(f"Process started with PID {self._process.pid}")
+        with self._state_lock:
+            self._processes.add(process)
+        logger.debug(f"Process started with PID {process.pid}")
 
         # Drain stdout/stderr in background threads to prevent deadlock.
         # Without draining, the OS pipe buffer (~64 KB) fills up and the
@@ -177,53 +283,80 @@ class CloudflareScanner:
         stdout_lines = []
         stderr_lines = []
 
-        def _drain(stream, sink):
+        def _drain(stream, sink, limit=OUTPUT_LOG_LINES):
             try:
                 for raw_line in stream:
-                    sink.append(raw_line)
+                    if len(sink) < limit:
+                        sink.append(raw_line)
             except Exception:
                 pass
             finally:
                 stream.close()
 
-        t_out = threading.Thread(target=_drain, args=(self._process.stdout, stdout_lines), daemon=True)
-        t_err = threading.Thread(target=_drain, args=(self._process.stderr, stderr_lines), daemon=True)
-        t_out.start()
-        t_err.start()
+        def _feed(stream, data):
+            try:
+                stream.write(data)
+            except OSError:
+                pass
+            finally:
+                try:
+                    stream.close()
+                except OSError:
+                    pass
+
+        drains = [
+            threading.Thread(target=_drain, args=(stream, sink), daemon=True)
+            for stream, sink in (
+                (process.stdout, stdout_lines),
+                (process.stderr, stderr_lines),
+            )
+            if stream is not None
+        ]
+        for t in drains:
+            t.start()
+        if input_data is not None:
+            threading.Thread(
+                target=_feed, args=(process.stdin, input_data), daemon=True
+            ).start()
 
         try:
             deadline = time.time() + timeout
-            while self._process.poll() is None:
+            while process.poll() is None:
                 if self._cancel_event.is_set():
-                    logger.info(f"Cancellation requested, terminating PID {self._process.pid}")
-                    self._process.terminate()
+                    logger.info(f"Cancellation requested, terminating PID {process.pid}")
+                    process.terminate()
                     try:
-                        self._process.wait(timeout=5)
+                        process.wait(timeout=5)
                     except subprocess.TimeoutExpired:
-                        logger.warning(f"Process did not terminate gracefully, killing PID {self._process.pid}")
-                        self._process.kill()
-                        self._process.wait()
+                        logger.warning(f"Process did not terminate gracefully, killing PID {process.pid}")
+                        process.kill()
+                        process.wait()
                     raise ScanCancelled()
                 if time.time() > deadline:
-                    logger.error(f"Process timed out after {timeout}s, killing PID {self._process.pid}")
-                    self._process.kill()
-                    self._process.wait()
+                    logger.error(f"Process timed out after {timeout}s, killing PID {process.pid}")
+                    process.kill()
+                    process.wait()
                     raise subprocess.TimeoutExpired(cmd, timeout)
                 time.sleep(0.5)
 
+            # cancel_scan() terminates the process itself, so it may already
+            # have exited when the loop last looked at the event.
+            if self._cancel_event.is_set():
+                raise ScanCancelled()
+
             # Wait for drain threads to finish reading remaining output
-            t_out.join(timeout=5)
-            t_err.join(timeout=5)
+            for t in drains:
+                t.join(timeout=5)
 
-            rc = self._process.returncode
+            rc = process.returncode
             stdout_text = b"".join(stdout_lines).decode("utf-8", errors="replace").strip()
             stderr_text = b"".join(stderr_lines).decode("utf-8", errors="replace").strip()
 
             if stdout_text:
-                for line in stdout_text.splitlines()[:50]:
+                for line in stdout_text.splitlines():
                     logger.debug(f"[scanner stdout] {line}")
             if stderr_text:
-                for line in stderr_text.splitlines()[:50]:
+                for line in stderr_text.splitlines():
                     logger.warning(f"[scanner stderr] {line}")
 
             if rc != 0:
@@ -231,84 +364,219 @@ class CloudflareScanner:
 
             return rc
         finally:
-            self._process = None
+            with self._state_lock:
+                self._processes.discard(process)
 
     # ── Parsing ──────────────────────────────────────────────────
 
-    def _parse_results(self, result_file: Path) -> List[ScanResult]:
-        results = []
-        if not result_file.exists():
+    def _iter_results(self, result_file: Path) -> Iterator[ScanResult]:
+        """Yield the scan results in ``result_file`` as they are read."""
+        # Reused result files are truncated rather than deleted, so an
+        # empty file is as much a sign of a failed scan as a missing one.
+        try:
+            result_size = result_file.stat().st_size
+        except FileNotFoundError:
             logger.warning(f"Result file not found: {result_file}")
-            return results
+            return
+        if not result_size:
+            logger.warning(f"Result file is empty: {result_file}")
+            return
 
+        parsed = 0
         skipped_lines = 0
         parse_errors = 0
         try:
-            with open(result_file, "r", encoding="utf-8", errors="ignore") as f:
-                for line_num, line in enumerate(f, 1):
-                    line = line.strip()
-                    if not line or ("IP" in line and "Latency" in line):
-                        skipped_lines += 1
+            with open(
+                result_file, "r", encoding="utf-8", errors="ignore", newline=""
+            ) as f:
+                reader = csv.reader(f)
+                # Only the first row can be the CSV header; checking it once
+                # keeps the substring scans out of the per-row loop.
+                header = ",".join(next(reader, ()))
+                if "IP" in header and "Latency" in header:
+                    skipped_lines += 1
+                else:
+                    f.seek(0)
+                    reader = csv.reader(f)
+
+                # int()/float() tolerate surrounding whitespace, so only the
+                # IP column needs stripping; bind the hot callables locally.
+                make = ScanResult
+                to_int, to_float = int, float
+                for parts in reader:
+                    if len(parts) < 6:
+                        if not "".join(parts).strip():
+                            skipped_lines += 1
+                            continue
+                        parse_errors += 1
+                        logger.debug(
+                            f"Line {reader.line_num} has {len(parts)} fields "
+                            f"(expected >= 6): {parts!r}"
+                        )
                         continue
-                    parts = line.split(",")
-                    if len(parts) >= 6:
-                        try:
-                            results.append(
-                                ScanResult(
-                                    ip_address=parts[0].strip(),
-                                    packets_sent=int(parts[1].strip()),
-                                    packets_received=int(parts[2].strip()),
-                                    loss_rate=float(parts[3].strip()),
-                                    latency_ms=float(parts[4].strip()),
-                                    download_speed=float(parts[5].strip()),
-                                )
-                            )
-                        except (ValueError, IndexError) as e:
-                            parse_errors += 1
-                            logger.debug(
-                                f"Failed to parse line {line_num}: "
-                                f"{line!r}, error: {e}"
-                            )
-                    else:
+                    try:
+                        result = make(
+                            parts[0].strip(),
+                            *map(to_int, parts[1:3]),
+                            *map(to_float, parts[3:6]),
+                        )
+                    except ValueError as e:
                         parse_errors += 1
                         logger.debug(
-                            f"Line {line_num} has {len(parts)} fields "
-                            f"(expected >= 6): {line!r}"
+                            f"Failed to parse line {reader.line_num}: "
+                            f"{parts!r}, error: {e}"
                         )
+                        continue
+                    parsed += 1
+                    yield result
         except Exception as e:
             logger.error(f"Failed to read result file {result_file}: {e}")
 
         logger.info(
-            f"Parsed result file: {len(results)} valid entries, "
+            f"Parsed result file: {parsed} valid entries, "
             f"{parse_errors} errors, {skipped_lines} skipped"
         )
-        return results
+
+    def _parse_results(self, result_file: Path) -> List[ScanResult]:
+        return list(self._iter_results(result_file))
 
     def _build_command(self, ip_file, result_file, config, extra_args=None):
-        cmd = [
-            str(self.binary_path),
-            "-f", str(ip_file),
-            "-o", str(result_file),
-            "-n", str(config["threads"]),
-            "-url", str(config["url"]),
-            "-t", str(config["ping_times"]),
-            "-dn", str(config["test_count"]),
-            "-dt", str(config["download_timeout"]),
-            "-tp", str(config["port"]),
-        ]
-        if config.get("httping"):
-            cmd.append("-httping")
-            httping_code = config.get("httping_code")
-            if httping_code:
-                cmd.extend(["-httping-code", str(httping_code)])
-        else:
-            cmd.extend(["-p", "0"])
-        if extra_args:
-            cmd.extend(extra_args)
+        """Return the scanner command line for ``config``.
+
+        Everything except the input/output paths depends only on the
+        config, which is identical for every scheduled or monitor run, so
+        the converted argument list is cached and only the two paths are
+        filled in per call.
+        """
+        key = (tuple(config.items()), tuple(extra_args or ()))
+        template = self._cmd_templates.get(key)
+        if template is None:
+            template = [
+                str(self.binary_path),
+                "-f", "",
+                "-o", "",
+                "-n", str(config["threads"]),
+                "-url", str(config["url"]),
+                "-t", str(config["ping_times"]),
+                "-dn", str(config["test_count"]),
+                "-dt", str(config["download_timeout"]),
+                "-tp", str(config["port"]),
+            ]
+            if config.get("httping"):
+                template.append("-httping")
+                httping_code = config.get("httping_code")
+                if httping_code:
+                    template.extend(["-httping-code", str(httping_code)])
+            else:
+                template.extend(["-p", "0"])
+            if extra_args:
+                template.extend(extra_args)
+            # Ad-hoc scans with custom thresholds each add a key; keep the
+            # cache from growing without bound.
+            if len(self._cmd_templates) >= 32:
+                self._cmd_templates.clear()
+            self._cmd_templates[key] = template
+
+        cmd = template.copy()
+        cmd[2] = str(ip_file)
+        cmd[4] = str(result_file)
         return cmd
 
     # ── Initial scan ─────────────────────────────────────────────
 
+    def _scan_shard(
+        self, ip_ranges, config, extra_args, prefix, tag=None
+    ) -> List[ScanResult]:
+        """Run one scanner process over ``ip_ranges`` and parse its output."""
+        ip_file, result_file, work_dir = self._temp_files(prefix, tag)
+        try:
+            if self._stdin_input:
+                logger.info(f"Piping {len(ip_ranges)} IP ranges to scanner stdin")
+                ip_source = STDIN_PATH
+                input_data = "\n".join(ip_ranges).encode()
+            else:
+                logger.info(f"Writing {len(ip_ranges)} IP ranges to {ip_file}")
+                _write_ip_file(ip_file, (f"{r}\n" for r in ip_ranges))
+                ip_source, input_data = ip_file, None
+
+            cmd = self._build_command(
+                ip_source, result_file, config, extra_args=extra_args
+            )
+
+            logger.info(f"Launching scanner binary for {prefix}...")
+            started = time.time()
+            rc = self._run_process(
+                cmd, timeout=3600, cwd=work_dir, input_data=input_data
+            )
+            logger.info(
+                f"Scanner process ({prefix}) finished in "
+                f"{time.time() - started:.1f}s with exit code {rc}"
+            )
+
+            if not result_file.exists():
+                logger.warning(
+                    f"Result file {result_file} not found after scan "
+                    f"(exit code {rc}). Scanner may have failed."
+                )
+            else:
+                result_size = result_file.stat().st_size
+                if rc != 0 or not result_size:
+                    logger.warning(
+                        f"Scanner exited with code {rc} leaving {result_size} "
+                        f"bytes in {result_file}. Scanner may have failed."
+                    )
+                else:
+                    logger.info(f"Result file size: {result_size} bytes")
+
+            return self._parse_results(result_file)
+        finally:
+            logger.debug(f"Cleaning up temp files: {ip_file}, {result_file}, {work_dir}")
+            self._cleanup(ip_file, result_file, work_dir, truncate=tag is not None)
+
+    def _scan_sharded(
+        self, ip_ranges, config, extra_args, shards, tag=None
+    ) -> List[ScanResult]:
+        """Split ``ip_ranges`` into ``shards`` slices scanned in parallel.
+
+        Each slice gets its own scanner process; the per-process thread
+        and download-test budgets are divided so the totals stay the same
+        as a single unsharded run.  Any shard failing (or the scan being
+        cancelled) propagates once all shards have stopped.
+        """
+        shard_config = dict(config)
+        shard_config["threads"] = max(1, config["threads"] // shards)
+        shard_config["test_count"] = max(1, -(-config["test_count"] // shards))
+        logger.info(
+            f"Splitting {len(ip_ranges)} IP ranges into {shards} shards "
+            f"(threads={shard_config['threads']}, "
+            f"test_count={shard_config['test_count']} per shard)"
+        )
+
+        results: List[ScanResult] = []
+        with ThreadPoolExecutor(
+            max_workers=shards, thread_name_prefix="scan-shard"
+        ) as pool:
+            futures = [
+                pool.submit(
+                    self._scan_shard,
+                    ip_ranges[k::shards],
+                    shard_config,
+                    extra_args,
+                    f"scan{k}",
+                    tag,
+                )
+                for k in range(shards)
+            ]
+            for future in as_completed(futures):
+                try:
+                    results.extend(future.result())
+                except BaseException:
+                    # Stop the sibling shards rather than letting them run
+                    # to completion for a scan that has already failed.
+                    self._cancel_event.set()
+                    raise
+        return results
+
     def initial_scan(
         self,
         ip_ranges=None,
@@ -318,13 +586,11 @@ class CloudflareScanner:
         test_count=None,
         threads=None,
     ) -> Tuple[List[ScanResult], Dict]:
-        if not self._lock.acquire(blocking=False):
+        if not self._try_begin_scan():
             logger.info("Initial scan skipped: another scan is already running")
             return [], {"status": "skipped", "reason": "scan already running"}
 
-        ip_file, result_file, work_dir = self._temp_files("scan")
         try:
-            self._is_scanning = True
             self._scan_start_time = time.time()
             self._cancel_event.clear()
 
@@ -351,58 +617,54 @@ class CloudflareScanner:
             )
 
             if ip_ranges is None:
-                ip_ranges = (
-                    Config.CLOUDFLARE_IPV4_RANGES + Config.CLOUDFLARE_IPV6_RANGES
-                )
-            logger.info(f"Writing {len(ip_ranges)} IP ranges to {ip_file}")
-            with open(ip_file, "w") as f:
-                f.write("\n".join(ip_ranges))
-
-            cmd = self._build_command(
-                ip_file,
-                result_file,
-                config,
-                extra_args=[
-                    "-tl", str(config["max_latency"]),
-                    "-tlr", str(config["max_loss_rate"]),
-                    "-sl", str(config["min_speed"]),
-                ],
-            )
-
-            logger.info("Launching scanner binary for initial scan...")
-            rc = self._run_process(cmd, timeout=3600, cwd=work_dir)
-            duration = time.time() - self._scan_start_time
-            logger.info(
-                f"Scanner process finished in {duration:.1f}s "
-                f"with exit code {rc}"
-            )
+                ip_ranges = Config.CLOUDFLARE_RANGES
+            extra_args = [
+                "-tl", str(config["max_latency"]),
+                "-tlr", str(config["max_loss_rate"]),
+                "-sl", str(config["min_speed"]),
+            ]
 
-            if not result_file.exists():
-                logger.warning(
-                    f"Result file {result_file} not found after scan "
-                    f"(exit code {rc}). Scanner may have failed."
+            # Scheduled scans alternate between two fixed sets of files,
+            # truncated after use, instead of creating fresh ones per run.
+            tag = None
+            if self._schedule_running:
+                tag = f"buf{self._buf_idx % 2}"
+                self._buf_idx += 1
+
+            shards = max(1, min(int(config.get("shards", 1)), len(ip_ranges)))
+            if shards == 1:
+                results = self._scan_shard(
+                    ip_ranges, config, extra_args, "scan", tag
                 )
             else:
-                result_size = result_file.stat().st_size
-                logger.info(f"Result file size: {result_size} bytes")
-
-            results = self._parse_results(result_file)
+                results = self._scan_sharded(
+                    ip_ranges, config, extra_args, shards, tag
+                )
+            duration = time.time() - self._scan_start_time
             logger.info(f"Parsed {len(results)} total IPs from scanner output")
 
-            filtered = [
-                r
-                for r in results
-                if r.download_speed >= config["min_speed"]
-                and r.loss_rate <= config["max_loss_rate"]
-                and r.latency_ms <= config["max_latency"]
-            ]
+            # One pass picks out the passing results and the fastest of
+            # them; the thresholds are looked up once rather than per row.
+            min_speed = config["min_speed"]
+            max_loss = config["max_loss_rate"]
+            max_latency = config["max_latency"]
+            filtered = []
+            best = None
+            for r in results:
+                if (
+                    r.download_speed >= min_speed
+                    and r.loss_rate <= max_loss
+                    and r.latency_ms <= max_latency
+                ):
+                    filtered.append(r)
+                    if best is None or r.download_speed > best.download_speed:
+                        best = r
             logger.info(
                 f"Filtered results: {len(filtered)}/{len(results)} IPs "
                 f"passed criteria"
             )
 
-            if filtered:
-                best = max(filtered, key=lambda r: r.download_speed)
+            if best is not None:
                 logger.info(
                     f"Best IP: {best.ip_address} "
                     f"(speed={best.download_speed:.2f} MB/s, "
@@ -411,19 +673,12 @@ class CloudflareScanner:
                 )
 
             logger.info("Saving results to database...")
-            with self.app.app_context():
-                for i, r in enumerate(filtered):
-                    add_test_result(
-                        ip_address=r.ip_address,
-                        latency_ms=r.latency_ms,
-                        download_speed=r.download_speed,
-                        loss_rate=r.loss_rate,
-                        packets_sent=r.packets_sent,
-                        packets_received=r.packets_received,
-                        test_type="initial_scan",
-                    )
-                    if (i + 1) % 10 == 0:
-                        logger.debug(f"Saved {i + 1}/{len(filtered)} IPs to database")
+            # Results and session are one transaction; hold the write lock
+            # across both.
+            with self._app_context(), db_write_lock:
+                add_test_results_bulk(
+                    filtered, test_type="initial_scan", commit=False
+                )
                 scan_id = add_scan_session(
                     total_tested=len(results),
                     passed=len(filtered),
@@ -473,16 +728,13 @@ class CloudflareScanner:
             return [], meta
 
         finally:
-            logger.debug(f"Cleaning up temp files: {ip_file}, {result_file}, {work_dir}")
-            self._cleanup(ip_file, result_file, work_dir)
-            self._is_scanning = False
             self._scan_start_time = None
-            self._lock.release()
-            logger.debug("Scan lock released")
+            self._scan_in_progress.clear()
+            logger.debug("Scan flag cleared")
 
     # ── Periodic tests (used by monitor) ─────────────────────────
 
-    def test_specific_ips(self, ip_addresses, timeout=None, threads=None):
+    def test_specific_ips(self, ip_addresses, timeout=None, threads=None, ip_ids=None):
         if not ip_addresses:
             logger.debug("test_specific_ips called with empty IP list, skipping")
             return []
@@ -503,21 +755,29 @@ class CloudflareScanner:
 
         ip_file, result_file, work_dir = self._temp_files("monitor")
         try:
-            with open(ip_file, "w") as f:
-                for ip in ip_addresses:
-                    suffix = "/128" if ":" in ip else "/32"
-                    f.write(f"{ip}{suffix}\n")
+            ip_lines = (
+                f"{ip}/128\n" if ":" in ip else f"{ip}/32\n"
+                for ip in ip_addresses
+            )
+            if self._stdin_input:
+                ip_source, input_data = STDIN_PATH, "".join(ip_lines).encode()
+            else:
+                _write_ip_file(ip_file, ip_lines)
+                ip_source, input_data = ip_file, None
 
             cmd = self._build_command(
-                ip_file, result_file, config, extra_args=["-allip"]
+                ip_source, result_file, config, extra_args=["-allip"]
             )
 
             logger.debug(f"Monitor scan command: {' '.join(str(c) for c in cmd)}")
             start_time = time.time()
+            # The scanner's console output (-p 0) is not used; keep stderr
+            # as bytes and only decode it if the run failed.
             proc = subprocess.run(
                 cmd,
-                capture_output=True,
-                text=True,
+                input=input_data,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
                 timeout=300,
                 cwd=str(work_dir),
             )
@@ -529,7 +789,8 @@ class CloudflareScanner:
                     f"after {elapsed:.1f}s"
                 )
                 if proc.stderr:
-                    for line in proc.stderr.strip().splitlines()[:20]:
+                    stderr_text = proc.stderr.decode("utf-8", errors="replace")
+                    for line in stderr_text.strip().splitlines()[:20]:
                         logger.warning(f"[monitor stderr] {line}")
 
             results = self._parse_results(result_file)
@@ -538,17 +799,8 @@ class CloudflareScanner:
                 f"{len(results)}/{len(ip_addresses)} IPs returned results"
             )
 
-            with self.app.app_context():
-                for r in results:
-                    add_test_result(
-                        ip_address=r.ip_address,
-                        latency_ms=r.latency_ms,
-                        download_speed=r.download_speed,
-                        loss_rate=r.loss_rate,
-                        packets_sent=r.packets_sent,
-                        packets_received=r.packets_received,
-                        test_type="periodic",
-                    )
+            with self._app_context():
+                add_test_results_bulk(results, test_type="periodic", ip_ids=ip_ids)
             logger.debug(f"Saved {len(results)} periodic test results to database")
 
             return results
@@ -568,10 +820,19 @@ class CloudflareScanner:
     # ── Cancellation & status ────────────────────────────────────
 
     def cancel_scan(self) -> bool:
-        """Cancel the currently running initial scan."""
+        """Cancel the currently running initial scan.
+
+        Every running shard process is terminated straight away; each
+        shard's poll loop then reaps it and raises ``ScanCancelled``.
+        """
         if self._is_scanning:
             logger.info("Scan cancellation requested")
             self._cancel_event.set()
+            with self._state_lock:
+                for process in self._processes:
+                    if process.poll() is None:
+                        logger.info(f"Terminating PID {process.pid}")
+                        process.terminate()
             return True
         logger.debug("Cancel requested but no scan is running")
         return False
@@ -596,31 +857,41 @@ class CloudflareScanner:
 
     def _schedule_loop(self):
         logger.info("Scan schedule loop started")
-        while not self._schedule_stop.is_set():
-            logger.info(
-                f"Scheduled scan #{self._schedule_scan_count + 1} starting..."
-            )
-            try:
-                _, meta = self.initial_scan()
-                status = meta.get("status", "unknown")
-                if status == "completed":
-                    self._schedule_scan_count += 1
-                    self._schedule_last_run = datetime.now().isoformat()
-                    logger.info(
-                        f"Scheduled scan completed "
-                        f"(total completed: {self._schedule_scan_count})"
-                    )
-                elif status == "skipped":
-                    logger.info("Scheduled scan skipped: another scan in progress")
-                else:
-                    logger.warning(f"Scheduled scan ended with status: {status}")
-            except Exception as e:
-                logger.error(f"Scheduled scan failed: {e}", exc_info=True)
-
-            logger.debug(
-                f"Waiting {self._schedule_interval}s until next scheduled scan"
-            )
-            self._schedule_stop.wait(self._schedule_interval)
+        # One app context for the lifetime of the scheduler thread;
+        # initial_scan() reuses it instead of pushing its own per run.
+        with self.app.app_context():
+            while not self._schedule_stop.is_set():
+                logger.info(
+                    f"Scheduled scan #{self._schedule_scan_count + 1} starting..."
+                )
+                try:
+                    if self._scan_in_progress.is_set():
+                        meta = {"status": "skipped"}
+                    else:
+                        _, meta = self.initial_scan()
+                    status = meta.get("status", "unknown")
+                    if status == "completed":
+                        self._schedule_scan_count += 1
+                        self._schedule_last_run = datetime.now().isoformat()
+                        logger.info(
+                            f"Scheduled scan completed "
+                            f"(total completed: {self._schedule_scan_count})"
+                        )
+                    elif status == "skipped":
+                        logger.info("Scheduled scan skipped: another scan in progress")
+                    else:
+                        logger.warning(f"Scheduled scan ended with status: {status}")
+                except Exception as e:
+                    logger.error(f"Scheduled scan failed: {e}", exc_info=True)
+                finally:
+                    # Release the DB connection (and any failed transaction)
+                    # while idle; the app context itself stays pushed.
+                    db.session.remove()
+
+                logger.debug(
+                    f"Waiting {self._schedule_interval}s until next scheduled scan"
+                )
+                self._schedule_stop.wait(self._schedule_interval)
         logger.info("Scan schedule loop exited")
 
     def start_schedule(self, interval=None):
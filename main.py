@@ -13,33 +13,103 @@ Usage:
 
 import argparse
 import csv
+import functools
+import heapq
+import io
 import json
 import logging
+import os
 import signal
 import sys
-import time
+import threading
 
-from app import create_app
-from app.config import Config
-from app.services.ip_service import get_active_ips
+try:
+    import orjson
+except ImportError:  # optional; speeds up JSON export
+    orjson = None
+
+# The app package pulls in Flask and SQLAlchemy; it is imported by the
+# commands that need it so --help and usage errors return immediately.
+
+_BAR = "=" * 60
+
+
+def _banner(title):
+    return f"\n{_BAR}\n  {title}\n{_BAR}"
+
+
+_SCAN_HEADER = _banner("Cloudflare IP Scanner - Initial Scan")
+_SCAN_DONE_HEADER = _banner("Scan Complete!")
+_MONITOR_HEADER = _banner("Cloudflare IP Monitor - Periodic Monitoring")
+_DASHBOARD_HEADER = _banner("Cloudflare IP Monitor - Web Dashboard")
+_ALL_HEADER = _banner("Cloudflare IP Monitor - Full Setup")
+_TOP_IPS_TABLE_HEADER = (
+    "\n  Top 10 IPs by Speed:\n"
+    f"  {'-' * 56}\n"
+    f"  {'IP Address':<20} {'Speed (MB/s)':<12} {'Latency (ms)':<12} Loss\n"
+    f"  {'-' * 56}\n"
+)
+
+# Fixed text of the status report; only the figures are filled in per call.
+_STATUS_TEMPLATE = _banner("Cloudflare IP Monitor - Status") + """
+
+  Database Status:
+    - Active IPs: {total_active}
+    - Total Tests: {total_tests}
+
+  Performance Averages:
+    - Avg Speed: {avg_speed:.2f} MB/s
+    - Best Speed: {best_speed:.2f} MB/s
+    - Avg Latency: {avg_latency:.0f} ms
+    - Best Latency: {best_latency:.0f} ms
+
+  Monitor Status:
+    - Running: {is_running}
+    - Interval: {interval}s
+    - Test Count: {test_count}
+"""
+
+CSV_EXPORT_FIELDS = (
+    "ip_address",
+    "avg_download_speed",
+    "avg_latency",
+    "avg_loss_rate",
+    "total_tests",
+)
+
+
+@functools.lru_cache(maxsize=1)
+def _app():
+    """The Flask app, built once per process however many commands use it."""
+    from app import create_app
+
+    return create_app()
+
+
+def _write(*lines):
+    """Print ``lines`` as one block with a single write to stdout."""
+    sys.stdout.write("\n".join(lines) + "\n")
+    sys.stdout.flush()
 
 
 def setup_logging(verbose=False):
+    from app.config import Config
+
     level = logging.DEBUG if verbose else logging.INFO
     logging.basicConfig(level=level, format=Config.LOG_FORMAT)
 
 
 def cmd_scan(args):
-    app = create_app()
-    print("\n" + "=" * 60)
-    print("  Cloudflare IP Scanner - Initial Scan")
-    print("=" * 60)
-    print(f"\nConfiguration:")
-    print(f"  - Min Speed: {args.min_speed} MB/s")
-    print(f"  - Max Latency: {args.max_latency} ms")
-    print(f"  - Max Loss Rate: {args.max_loss}")
-    print(f"  - IPs to Test: {args.test_count}")
-    print(f"\nStarting scan... This may take several minutes.\n")
+    app = _app()
+    _write(
+        _SCAN_HEADER,
+        "\nConfiguration:",
+        f"  - Min Speed: {args.min_speed} MB/s",
+        f"  - Max Latency: {args.max_latency} ms",
+        f"  - Max Loss Rate: {args.max_loss}",
+        f"  - IPs to Test: {args.test_count}",
+        "\nStarting scan... This may take several minutes.\n",
+    )
 
     try:
         results, metadata = app.scanner.initial_scan(
@@ -50,29 +120,23 @@ def cmd_scan(args):
             threads=args.threads,
         )
 
-        print("\n" + "=" * 60)
-        print("  Scan Complete!")
-        print("=" * 60)
-        print(f"\n  Total IPs Tested: {metadata.get('total_tested', 0)}")
-        print(f"  IPs Passed Criteria: {metadata.get('passed', 0)}")
-        print(f"  Duration: {metadata.get('duration_seconds', 0):.1f} seconds")
+        _write(
+            _SCAN_DONE_HEADER,
+            f"\n  Total IPs Tested: {metadata.get('total_tested', 0)}",
+            f"  IPs Passed Criteria: {metadata.get('passed', 0)}",
+            f"  Duration: {metadata.get('duration_seconds', 0):.1f} seconds",
+        )
 
+        buf = io.StringIO()
         if results:
-            print("\n  Top 10 IPs by Speed:")
-            print("  " + "-" * 56)
-            print(
-                f"  {'IP Address':<20} {'Speed (MB/s)':<12} {'Latency (ms)':<12} {'Loss'}"
-            )
-            print("  " + "-" * 56)
-            for r in sorted(results, key=lambda x: x.download_speed, reverse=True)[
-                :10
-            ]:
-                print(
+            buf.write(_TOP_IPS_TABLE_HEADER)
+            for r in heapq.nlargest(10, results, key=lambda x: x.download_speed):
+                buf.write(
                     f"  {r.ip_address:<20} {r.download_speed:<12.2f} "
-                    f"{r.latency_ms:<12.0f} {r.loss_rate:.2%}"
+                    f"{r.latency_ms:<12.0f} {r.loss_rate:.2%}\n"
                 )
-
-        print("\n")
+        buf.write("\n")
+        _write(buf.getvalue())
         return 0
 
     except Exception as e:
@@ -81,12 +145,12 @@ def cmd_scan(args):
 
 
 def cmd_monitor(args):
-    app = create_app()
-    print("\n" + "=" * 60)
-    print("  Cloudflare IP Monitor - Periodic Monitoring")
-    print("=" * 60)
-    print(f"\n  Interval: {args.interval} seconds")
-    print(f"  Press Ctrl+C to stop\n")
+    app = _app()
+    _write(
+        _MONITOR_HEADER,
+        f"\n  Interval: {args.interval} seconds",
+        "  Press Ctrl+C to stop\n",
+    )
 
     monitor = app.monitor
     monitor.set_interval(args.interval)
@@ -98,34 +162,40 @@ def cmd_monitor(args):
 
     monitor.start(run_immediately=True)
 
+    # Sleep until a signal arrives instead of polling the monitor.
+    shutdown = threading.Event()
+
     def signal_handler(signum, frame):
         logging.info(f"Received signal {signum}, shutting down...")
-        monitor.stop()
-        sys.exit(0)
+        shutdown.set()
 
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
 
-    try:
-        while monitor.is_running():
-            time.sleep(1)
-    except KeyboardInterrupt:
-        print("\nStopping monitor...")
-        monitor.stop()
+    if os.name == "nt":
+        # Windows cannot interrupt a lock wait with Ctrl+C, so wake up once
+        # a second to let the signal handler run. POSIX delivers the signal
+        # during an untimed wait.
+        while not shutdown.wait(1):
+            pass
+    else:
+        shutdown.wait()
+    print("\nStopping monitor...")
+    monitor.stop()
 
     return 0
 
 
 def cmd_dashboard(args):
-    app = create_app()
-    print("\n" + "=" * 60)
-    print("  Cloudflare IP Monitor - Web Dashboard")
-    print("=" * 60)
-    print(f"  Running at: http://localhost:{args.port}")
-    print(f"\n  Admin Login:")
-    print(f"    Username: {Config.ADMIN_USERNAME}")
-    print(f"    Password: {Config.ADMIN_PASSWORD}")
-    print("=" * 60 + "\n")
+    app = _app()
+    _write(
+        _DASHBOARD_HEADER,
+        f"  Running at: http://localhost:{args.port}",
+        "\n  Admin Login:",
+        f"    Username: {app.config['ADMIN_USERNAME']}",
+        f"    Password: {app.config['ADMIN_PASSWORD']}",
+        _BAR + "\n",
+    )
 
     if not args.no_monitor:
         app.monitor.start(run_immediately=False)
@@ -140,20 +210,34 @@ def cmd_dashboard(args):
 
 
 def cmd_all(args):
-    app = create_app()
-    print("\n" + "=" * 60)
-    print("  Cloudflare IP Monitor - Full Setup")
-    print("=" * 60)
+    app = _app()
+    print(_ALL_HEADER)
 
     with app.app_context():
-        active_ips = get_active_ips()
+        from sqlalchemy import func, select
 
-    if not active_ips or args.force_scan:
-        print("\nNo active IPs found. Running initial scan first...")
-        print(f"  - Min Speed: {args.min_speed} MB/s")
-        print(f"  - Max Latency: {args.max_latency} ms")
-        print(f"  - Max Loss Rate: {args.max_loss}")
-        print(f"\nThis may take several minutes...\n")
+        from app.extensions import db
+        from app.models import IP
+
+        # Probe for a single active IP first; count them only when there
+        # are some and the number is going to be shown.
+        active = IP.is_active.is_(True)
+        active_count = 0
+        if not args.force_scan and db.session.execute(
+            select(IP.id).where(active).limit(1)
+        ).first():
+            active_count = db.session.execute(
+                select(func.count()).where(active)
+            ).scalar()
+
+    if args.force_scan or not active_count:
+        _write(
+            "\nNo active IPs found. Running initial scan first...",
+            f"  - Min Speed: {args.min_speed} MB/s",
+            f"  - Max Latency: {args.max_latency} ms",
+            f"  - Max Loss Rate: {args.max_loss}",
+            "\nThis may take several minutes...\n",
+        )
 
         results, metadata = app.scanner.initial_scan(
             min_speed=args.min_speed,
@@ -163,14 +247,16 @@ def cmd_all(args):
         )
         print(f"\nInitial scan complete: {metadata.get('passed', 0)} IPs found")
     else:
-        print(f"\nFound {len(active_ips)} active IPs in database")
-
-    print(f"\nStarting dashboard and monitoring...")
-    print(f"  - Dashboard: http://localhost:{args.port}")
-    print(f"  - Monitor Interval: {args.interval} seconds")
-    print(f"\n  Admin Login:")
-    print(f"    Username: {Config.ADMIN_USERNAME}")
-    print(f"    Password: {Config.ADMIN_PASSWORD}")
+        print(f"\nFound {active_count} active IPs in database")
+
+    _write(
+        "\nStarting dashboard and monitoring...",
+        f"  - Dashboard: http://localhost:{args.port}",
+        f"  - Monitor Interval: {args.interval} seconds",
+        "\n  Admin Login:",
+        f"    Username: {app.config['ADMIN_USERNAME']}",
+        f"    Password: {app.config['ADMIN_PASSWORD']}",
+    )
 
     app.monitor.set_interval(args.interval)
     app.monitor.start(run_immediately=True)
@@ -185,211 +271,252 @@ def cmd_all(args):
 
 
 def cmd_status(args):
-    app = create_app()
+    app = _app()
     with app.app_context():
-        from sqlalchemy import func
+        from sqlalchemy import func, select
 
         from app.extensions import db
         from app.models import IP, TestResult
 
-        total_active = IP.query.filter_by(is_active=True).count()
-        total_tests = TestResult.query.count()
+        active = IP.is_active.is_(True)
 
-        row = (
-            db.session.query(
+        # Counts and averages in one statement; the top five as plain rows.
+        total_active, total_tests, *row = db.session.execute(
+            select(
+                func.count(),
+                select(func.count()).select_from(TestResult).scalar_subquery(),
                 func.avg(IP.avg_download_speed),
                 func.max(IP.best_download_speed),
                 func.avg(IP.avg_latency),
                 func.min(IP.best_latency),
-            )
-            .filter(IP.is_active == True)  # noqa: E712
-            .first()
-        )
-
-        print("\n" + "=" * 60)
-        print("  Cloudflare IP Monitor - Status")
-        print("=" * 60)
-        print(f"\n  Database Status:")
-        print(f"    - Active IPs: {total_active}")
-        print(f"    - Total Tests: {total_tests}")
-        print(f"\n  Performance Averages:")
-        print(f"    - Avg Speed: {(row[0] or 0):.2f} MB/s")
-        print(f"    - Best Speed: {(row[1] or 0):.2f} MB/s")
-        print(f"    - Avg Latency: {(row[2] or 0):.0f} ms")
-        print(f"    - Best Latency: {(row[3] or 0):.0f} ms")
-
-        monitor_status = app.monitor.get_status()
-        print(f"\n  Monitor Status:")
-        print(f"    - Running: {monitor_status.get('is_running', False)}")
-        print(f"    - Interval: {monitor_status.get('interval_seconds', 0)}s")
-        print(f"    - Test Count: {monitor_status.get('test_count', 0)}")
-
-        top_ips = (
-            IP.query.filter_by(is_active=True)
+            ).where(active)
+        ).one()
+        top_ips = db.session.execute(
+            select(IP.ip_address, IP.avg_download_speed)
+            .where(active)
             .order_by(IP.avg_download_speed.desc())
             .limit(5)
-            .all()
+        ).all()
+
+        monitor_status = app.monitor.get_status()
+        out = _STATUS_TEMPLATE.format(
+            total_active=total_active,
+            total_tests=total_tests,
+            avg_speed=row[0] or 0,
+            best_speed=row[1] or 0,
+            avg_latency=row[2] or 0,
+            best_latency=row[3] or 0,
+            is_running=monitor_status.get("is_running", False),
+            interval=monitor_status.get("interval_seconds", 0),
+            test_count=monitor_status.get("test_count", 0),
         )
         if top_ips:
-            print(f"\n  Top IPs by Speed:")
-            for ip in top_ips:
-                print(
-                    f"    - {ip.ip_address}: {(ip.avg_download_speed or 0):.2f} MB/s"
-                )
-
-        print("\n")
+            out += "\n  Top IPs by Speed:\n" + "".join(
+                f"    - {ip.ip_address}: {(ip.avg_download_speed or 0):.2f} MB/s\n"
+                for ip in top_ips
+            )
+        _write(out + "\n")
     return 0
 
 
+def _dumps_indented(item):
+    """Serialize ``item`` as indented JSON bytes, via orjson if installed."""
+    if orjson is not None:
+        return orjson.dumps(item, default=str, option=orjson.OPT_INDENT_2)
+    return json.dumps(item, indent=2, default=str).encode()
+
+
+def _write_json_array(f, items):
+    """Write ``items`` to binary file ``f`` as an indented JSON array.
+
+    Elements are serialized one at a time, giving the layout of
+    ``json.dump(list(items), f, indent=2)`` without holding the list.
+    """
+    first = True
+    for item in items:
+        f.write(b"[\n  " if first else b",\n  ")
+        f.write(_dumps_indented(item).replace(b"\n", b"\n  "))
+        first = False
+    f.write(b"[]" if first else b"\n]")
+
+
 def cmd_export(args):
-    app = create_app()
+    app = _app()
     with app.app_context():
-        from app.models import IP
+        from app.models import ip_row_to_dict
+        from app.services.ip_service import iter_active_ip_addresses, iter_active_ips
 
-        ips = (
-            IP.query.filter_by(is_active=True)
-            .order_by(IP.avg_download_speed.desc())
-            .all()
-        )
+        # Rows are streamed from the database in batches and written as
+        # they arrive; count them on the way through.
+        count = 0
+
+        def rows(source=iter_active_ips):
+            nonlocal count
+            for row in source():
+                count += 1
+                yield row
 
         if args.format == "txt":
             with open(args.output, "w") as f:
-                for ip in ips:
+                for ip in rows(iter_active_ip_addresses):
                     f.write(f"{ip.ip_address}\n")
         elif args.format == "csv":
             with open(args.output, "w", newline="") as f:
-                writer = csv.DictWriter(
-                    f,
-                    fieldnames=[
-                        "ip_address",
-                        "avg_download_speed",
-                        "avg_latency",
-                        "avg_loss_rate",
-                        "total_tests",
-                    ],
-                )
-                writer.writeheader()
-                for ip in ips:
-                    writer.writerow(
-                        {
-                            "ip_address": ip.ip_address,
-                            "avg_download_speed": ip.avg_download_speed or 0,
-                            "avg_latency": ip.avg_latency or 0,
-                            "avg_loss_rate": ip.avg_loss_rate or 0,
-                            "total_tests": ip.total_tests or 0,
-                        }
+                writer = csv.writer(f)
+                writer.writerow(CSV_EXPORT_FIELDS)
+                writer.writerows(
+                    (
+                        ip.ip_address,
+                        ip.avg_download_speed or 0,
+                        ip.avg_latency or 0,
+                        ip.avg_loss_rate or 0,
+                        ip.total_tests or 0,
                     )
+                    for ip in rows()
+                )
         elif args.format == "json":
-            with open(args.output, "w") as f:
-                json.dump([ip.to_dict() for ip in ips], f, indent=2, default=str)
+            with open(args.output, "wb") as f:
+                _write_json_array(f, (ip_row_to_dict(ip) for ip in rows()))
 
-        print(f"Exported {len(ips)} IPs to {args.output}")
+        print(f"Exported {count} IPs to {args.output}")
     return 0
 
 
-def main():
-    parser = argparse.ArgumentParser(
-        description="Cloudflare IP Monitor - Discover and monitor optimal Cloudflare IPs",
-        formatter_class=argparse.RawDescriptionHelpFormatter,
-        epilog="""
-Examples:
-  python main.py all                    # Run everything (recommended for first time)
-  python main.py scan -s 15             # Scan for IPs with min 15 MB/s speed
-  python main.py dashboard              # Start web dashboard only
-  python main.py monitor -i 300         # Monitor every 5 minutes
-  python main.py status                 # Show current status
-  python main.py export -o ips.txt      # Export IPs to file
-        """,
-    )
+# Option defaults come from Config, so the CLI follows the same .env
+# settings as the services. The builders below only run for the command
+# being invoked, which loads the app package anyway.
 
-    parser.add_argument("-v", "--verbose", action="store_true", help="Verbose logging")
 
-    subparsers = parser.add_subparsers(dest="command", help="Commands")
+def _add_scan_criteria(parser):
+    """Add the scan filter options shared by ``scan`` and ``all``."""
+    from app.config import Config
 
-    # Scan command
-    scan_parser = subparsers.add_parser("scan", help="Run initial scan to discover IPs")
-    scan_parser.add_argument(
-        "-s", "--min-speed", type=float, default=10.0, help="Min speed in MB/s"
+    defaults = Config.INITIAL_SCAN
+    parser.add_argument(
+        "-s", "--min-speed", type=float, default=defaults["min_speed"],
+        help="Min speed in MB/s",
     )
-    scan_parser.add_argument(
-        "-l", "--max-latency", type=int, default=1000, help="Max latency in ms"
+    parser.add_argument(
+        "-l", "--max-latency", type=int, default=defaults["max_latency"],
+        help="Max latency in ms",
     )
-    scan_parser.add_argument(
-        "-r", "--max-loss", type=float, default=0.25, help="Max loss rate"
+    parser.add_argument(
+        "-r", "--max-loss", type=float, default=defaults["max_loss_rate"],
+        help="Max loss rate",
     )
-    scan_parser.add_argument(
-        "-n", "--test-count", type=int, default=50, help="Number of IPs to test"
+    parser.add_argument(
+        "-n", "--test-count", type=int, default=defaults["test_count"],
+        help="Number of IPs to test",
     )
-    scan_parser.add_argument(
-        "-t", "--threads", type=int, default=300, help="Concurrent threads"
+
+
+def _scan_arguments(parser):
+    from app.config import Config
+
+    _add_scan_criteria(parser)
+    parser.add_argument(
+        "-t", "--threads", type=int, default=Config.INITIAL_SCAN["threads"],
+        help="Concurrent threads",
     )
-    scan_parser.set_defaults(func=cmd_scan)
 
-    # Monitor command
-    monitor_parser = subparsers.add_parser("monitor", help="Start periodic monitoring")
-    monitor_parser.add_argument(
-        "-i", "--interval", type=int, default=120, help="Test interval in seconds"
+
+def _monitor_arguments(parser):
+    from app.config import Config
+
+    parser.add_argument(
+        "-i", "--interval", type=int, default=Config.MONITOR["interval_seconds"],
+        help="Test interval in seconds",
     )
-    monitor_parser.add_argument(
+    parser.add_argument(
         "--scan-first", action="store_true", help="Run initial scan before monitoring"
     )
-    monitor_parser.set_defaults(func=cmd_monitor)
 
-    # Dashboard command
-    dash_parser = subparsers.add_parser("dashboard", help="Start web dashboard")
-    dash_parser.add_argument("--host", default="0.0.0.0", help="Host to bind to")
-    dash_parser.add_argument(
-        "--port", type=int, default=8080, help="Port to listen on"
-    )
-    dash_parser.add_argument(
-        "--no-monitor", action="store_true", help="Do not auto-start monitor"
-    )
-    dash_parser.set_defaults(func=cmd_dashboard)
 
-    # All command (recommended)
-    all_parser = subparsers.add_parser(
-        "all", help="Run initial scan (if needed) + dashboard + monitoring"
-    )
-    all_parser.add_argument(
-        "-s", "--min-speed", type=float, default=10.0, help="Min speed in MB/s"
-    )
-    all_parser.add_argument(
-        "-l", "--max-latency", type=int, default=1000, help="Max latency in ms"
+def _dashboard_arguments(parser):
+    from app.config import Config
+
+    parser.add_argument(
+        "--host", default=Config.DASHBOARD_HOST, help="Host to bind to"
     )
-    all_parser.add_argument(
-        "-r", "--max-loss", type=float, default=0.25, help="Max loss rate"
+    parser.add_argument(
+        "--port", type=int, default=Config.DASHBOARD_PORT, help="Port to listen on"
     )
-    all_parser.add_argument(
-        "-n", "--test-count", type=int, default=50, help="Number of IPs to test"
+    parser.add_argument(
+        "--no-monitor", action="store_true", help="Do not auto-start monitor"
     )
-    all_parser.add_argument(
-        "-i", "--interval", type=int, default=120, help="Monitor interval in seconds"
+
+
+def _all_arguments(parser):
+    from app.config import Config
+
+    _add_scan_criteria(parser)
+    parser.add_argument(
+        "-i", "--interval", type=int, default=Config.MONITOR["interval_seconds"],
+        help="Monitor interval in seconds",
     )
-    all_parser.add_argument("--host", default="0.0.0.0", help="Dashboard host")
-    all_parser.add_argument(
-        "--port", type=int, default=8080, help="Dashboard port"
+    parser.add_argument("--host", default=Config.DASHBOARD_HOST, help="Dashboard host")
+    parser.add_argument(
+        "--port", type=int, default=Config.DASHBOARD_PORT, help="Dashboard port"
     )
-    all_parser.add_argument(
+    parser.add_argument(
         "--force-scan", action="store_true", help="Force initial scan even if IPs exist"
     )
-    all_parser.set_defaults(func=cmd_all)
 
-    # Status command
-    status_parser = subparsers.add_parser("status", help="Show current status")
-    status_parser.set_defaults(func=cmd_status)
 
-    # Export command
-    export_parser = subparsers.add_parser("export", help="Export IPs to file")
-    export_parser.add_argument(
-        "-o", "--output", default="ips.txt", help="Output file"
-    )
-    export_parser.add_argument(
+def _export_arguments(parser):
+    parser.add_argument("-o", "--output", default="ips.txt", help="Output file")
+    parser.add_argument(
         "-f", "--format", choices=["txt", "csv", "json"], default="txt",
         help="Output format",
     )
-    export_parser.set_defaults(func=cmd_export)
 
-    args = parser.parse_args()
+
+# name -> (help, function adding the command's options, handler)
+COMMANDS = {
+    "scan": ("Run initial scan to discover IPs", _scan_arguments, cmd_scan),
+    "monitor": ("Start periodic monitoring", _monitor_arguments, cmd_monitor),
+    "dashboard": ("Start web dashboard", _dashboard_arguments, cmd_dashboard),
+    "all": (
+        "Run initial scan (if needed) + dashboard + monitoring",
+        _all_arguments,
+        cmd_all,
+    ),
+    "status": ("Show current status", None, cmd_status),
+    "export": ("Export IPs to file", _export_arguments, cmd_export),
+}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+
+    parser = argparse.ArgumentParser(
+        description="Cloudflare IP Monitor - Discover and monitor optimal Cloudflare IPs",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  python main.py all                    # Run everything (recommended for first time)
+  python main.py scan -s 15             # Scan for IPs with min 15 MB/s speed
+  python main.py dashboard              # Start web dashboard only
+  python main.py monitor -i 300         # Monitor every 5 minutes
+  python main.py status                 # Show current status
+  python main.py export -o ips.txt      # Export IPs to file
+        """,
+    )
+
+    parser.add_argument("-v", "--verbose", action="store_true", help="Verbose logging")
+
+    subparsers = parser.add_subparsers(dest="command", help="Commands")
+
+    # Every command is listed, but only the one being run gets its options
+    # declared; the rest are never used in this invocation.
+    command = next((arg for arg in argv if arg in COMMANDS), None)
+    for name, (help_text, add_arguments, func) in COMMANDS.items():
+        sub = subparsers.add_parser(name, help=help_text)
+        if name == command and add_arguments is not None:
+            add_arguments(sub)
+        sub.set_defaults(func=func)
+
+    args = parser.parse_args(argv)
 
     if not args.command:
         parser.print_help()
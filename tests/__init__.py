@@ -0,0 +1,48 @@
+import os
+import tempfile
+import unittest
+
+# Config is read at import time, so point it at a scratch directory first.
+# A placeholder scanner binary keeps create_app from downloading the real one.
+_TMP = tempfile.mkdtemp()
+_SCANNER = os.path.join(_TMP, "scanner", "CloudflareScanner")
+os.makedirs(os.path.dirname(_SCANNER))
+open(_SCANNER, "w").close()
+DB_PATH = os.path.join(_TMP, "test.db")
+os.environ.update(
+    DATA_DIR=os.path.join(_TMP, "data"),
+    LOGS_DIR=os.path.join(_TMP, "logs"),
+    SCANNER_DIR=os.path.dirname(_SCANNER),
+    SCANNER_BINARY=_SCANNER,
+    DATABASE_URL=f"sqlite:///{DB_PATH}",
+    LOG_LEVEL="WARNING",
+)
+
+from app import create_app  # noqa: E402
+from app.extensions import db  # noqa: E402
+from app.services.ip_service import add_test_results_bulk  # noqa: E402
+from app.services.scanner import ScanResult  # noqa: E402
+
+
+def record(address, latency, speed, loss=0.0, colo=None):
+    """Store one test result the way the scanner does."""
+    add_test_results_bulk([ScanResult(address, 4, 4, loss, latency, speed, colo)])
+
+
+class AppTestCase(unittest.TestCase):
+    """Runs each test against a fresh database inside an app context."""
+
+    def setUp(self):
+        self.app = create_app()
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+
+    def tearDown(self):
+        db.session.remove()
+        db.engine.dispose()
+        self.ctx.pop()
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(DB_PATH + suffix)
+            except FileNotFoundError:
+                pass
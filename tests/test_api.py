@@ -0,0 +1,48 @@
+from app.extensions import db
+from app.models import IP
+from tests import AppTestCase, record
+
+
+class ApiTestCase(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = self.app.test_client()
+        with self.client.session_transaction() as session:
+            session["logged_in"] = True
+
+
+class StatsTest(ApiTestCase):
+    def _top_ips(self):
+        stats = self.client.get("/api/stats").get_json()
+        return [ip["ip_address"] for ip in stats["top_ips"]]
+
+    def test_swapping_active_ips_refreshes_cached_stats(self):
+        record("104.16.0.1", 10, 50.0)
+        record("104.16.0.2", 10, 5.0)
+        IP.query.filter_by(ip_address="104.16.0.2").update({"is_active": False})
+        db.session.commit()
+        self.assertEqual(self._top_ips(), ["104.16.0.1"])
+
+        # Same active count, no new results or scans.
+        self.client.post("/api/ip/deactivate", json={"ip": "104.16.0.1"})
+        IP.query.filter_by(ip_address="104.16.0.2").update({"is_active": True})
+        db.session.commit()
+
+        self.assertEqual(self._top_ips(), ["104.16.0.2"])
+
+
+class SearchTest(ApiTestCase):
+    def _search(self, term):
+        ips = self.client.get("/api/ips", query_string={"search": term}).get_json()
+        return sorted(ip["ip_address"] for ip in ips["ips"])
+
+    def test_prefix_and_substring_search(self):
+        for address in ("104.16.0.1", "104.16.9.9", "104.160.0.1", "172.64.16.1"):
+            record(address, 10, 5.0)
+
+        self.assertEqual(self._search("104.16.*"), ["104.16.0.1", "104.16.9.9"])
+        self.assertEqual(
+            self._search("104.16*"), ["104.16.0.1", "104.16.9.9", "104.160.0.1"]
+        )
+        self.assertEqual(self._search("16.1"), ["172.64.16.1"])
+        self.assertEqual(len(self._search("*")), 4)
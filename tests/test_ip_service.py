@@ -0,0 +1,150 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import insert, select, text
+
+from app.extensions import db
+from app.models import IP, TestResult, TestResultHourly
+from app.services.ip_service import (
+    add_test_results_bulk,
+    cleanup_old_data,
+    get_ip,
+    recompute_ip_stats,
+)
+from app.services.scanner import ScanResult
+from tests import AppTestCase, record
+
+_AGGREGATES = (
+    IP.total_tests,
+    IP.latency_count,
+    IP.latency_sum,
+    IP.speed_count,
+    IP.speed_sum,
+    IP.loss_count,
+    IP.loss_sum,
+    IP.avg_latency,
+    IP.avg_download_speed,
+    IP.avg_loss_rate,
+    IP.best_latency,
+    IP.best_download_speed,
+    IP.worst_latency,
+    IP.worst_download_speed,
+)
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class AggregatesTest(AppTestCase):
+    def _aggregates(self):
+        return db.session.execute(select(*_AGGREGATES).order_by(IP.id)).all()
+
+    def test_trigger_matches_recompute(self):
+        record("104.16.0.1", 120, 8.0, 0.25)
+        record("104.16.0.1", None, 12.5, 0.0)
+        record("104.16.0.1", 80, None, None)
+        record("104.16.0.2", 300, 1.0, 0.5)
+        by_trigger = self._aggregates()
+
+        recompute_ip_stats()
+        db.session.commit()
+
+        for triggered, recomputed in zip(by_trigger, self._aggregates()):
+            for a, b in zip(triggered, recomputed):
+                if a is None or b is None:
+                    self.assertIs(a, b)
+                else:
+                    self.assertAlmostEqual(a, b)
+
+        ip = get_ip("104.16.0.1")
+        self.assertEqual(ip.latency_count, 2)
+        self.assertEqual(ip.avg_latency, 100)
+        self.assertEqual(ip.speed_count, 2)
+        self.assertEqual(ip.worst_download_speed, 8.0)
+
+    def test_purged_ip_stats_restart_from_new_results(self):
+        record("104.16.0.1", 600, 5.0)
+        record("104.16.0.1", 500, 6.0)
+        db.session.execute(
+            text("UPDATE test_results SET test_time = datetime('now', '-10 days')")
+        )
+        db.session.commit()
+
+        self.assertEqual(cleanup_old_data(1), 2)
+        record("104.16.0.1", 10, 20.0)
+
+        ip = get_ip("104.16.0.1")
+        self.assertEqual(ip.avg_latency, 10)
+        self.assertEqual(ip.worst_latency, 10)
+        self.assertEqual(ip.best_latency, 10)
+        self.assertEqual(ip.avg_download_speed, 20.0)
+        self.assertEqual(ip.total_tests, 3)
+
+
+class HourlyRollupTest(AppTestCase):
+    def test_rollup_after_purge(self):
+        record("104.16.0.1", 100, 5.0)
+        ip_id = get_ip("104.16.0.1").id
+        old = datetime(2020, 1, 1, 10, 15)
+        new = _utcnow()
+        db.session.execute(text("DELETE FROM test_results"))
+        db.session.execute(
+            insert(TestResult),
+            [
+                {"ip_id": ip_id, "test_time": old, "latency_ms": 100,
+                 "download_speed_mbps": 5.0, "loss_rate": 0.0},
+                {"ip_id": ip_id, "test_time": old + timedelta(minutes=30),
+                 "latency_ms": None, "download_speed_mbps": 7.0,
+                 "loss_rate": 0.5},
+                {"ip_id": ip_id, "test_time": new, "latency_ms": 40,
+                 "download_speed_mbps": 9.0, "loss_rate": None},
+            ],
+        )
+        db.session.commit()
+        self.assertEqual(
+            db.session.get(TestResultHourly, "2020-01-01 10:00").test_count, 2
+        )
+
+        self.assertEqual(cleanup_old_data(1), 2)
+
+        rows = db.session.execute(select(TestResultHourly)).scalars().all()
+        self.assertEqual([r.hour for r in rows], [new.strftime("%Y-%m-%d %H:00")])
+        row = rows[0]
+        self.assertEqual(
+            (row.test_count, row.latency_count, row.latency_sum),
+            (1, 1, 40),
+        )
+        self.assertEqual((row.speed_count, row.speed_sum), (1, 9.0))
+        self.assertEqual((row.loss_count, row.loss_sum), (0, 0))
+
+
+class BulkInsertTest(AppTestCase):
+    def test_ipv6_spellings_share_one_row(self):
+        add_test_results_bulk(
+            [
+                ScanResult("2606:4700::1", 4, 4, 0.0, 10, 5.0, None),
+                ScanResult("2606:4700:0::1", 4, 4, 0.0, 20, 5.0, "FRA"),
+            ]
+        )
+        record("2606:4700:0:0::1", 30, 5.0)
+
+        rows = db.session.execute(select(IP.ip_address, IP.total_tests)).all()
+        self.assertEqual(rows, [("2606:4700::1", 3)])
+        ip = get_ip("2606:4700:0000::1")
+        self.assertEqual(ip.colo_code, "FRA")
+        self.assertEqual(ip.avg_latency, 20)
+
+    def test_known_ids_are_not_modified(self):
+        record("104.16.0.1", 10, 5.0)
+        ip_ids = {"104.16.0.1": get_ip("104.16.0.1").id}
+        add_test_results_bulk(
+            [
+                ScanResult("104.16.0.1", 4, 4, 0.0, 20, 5.0, None),
+                ScanResult("104.16.0.2", 4, 4, 0.0, 30, 5.0, None),
+            ],
+            ip_ids=ip_ids,
+        )
+
+        self.assertEqual(list(ip_ids), ["104.16.0.1"])
+        self.assertEqual(get_ip("104.16.0.1").total_tests, 2)
+        self.assertEqual(get_ip("104.16.0.2").total_tests, 1)
@@ -0,0 +1,104 @@
+import sqlite3
+
+from sqlalchemy import inspect, select, text
+
+from app.extensions import db
+from app.models import IP, TestResultHourly
+from tests import DB_PATH, AppTestCase
+
+# The schema as first released: no packed addresses, running sums, rollup
+# table or triggers, and the single-column indexes since replaced.
+_BASELINE_SCHEMA = """
+    CREATE TABLE ips (
+        id INTEGER NOT NULL PRIMARY KEY,
+        ip_address VARCHAR(45) NOT NULL,
+        first_seen DATETIME,
+        last_tested DATETIME,
+        is_active BOOLEAN,
+        total_tests INTEGER,
+        avg_latency FLOAT,
+        avg_download_speed FLOAT,
+        avg_upload_speed FLOAT,
+        avg_loss_rate FLOAT,
+        best_latency FLOAT,
+        best_download_speed FLOAT,
+        worst_latency FLOAT,
+        worst_download_speed FLOAT,
+        colo_code VARCHAR(10),
+        created_at DATETIME
+    );
+    CREATE UNIQUE INDEX ix_ips_ip_address ON ips (ip_address);
+    CREATE INDEX ix_ips_is_active ON ips (is_active);
+    CREATE TABLE test_results (
+        id INTEGER NOT NULL PRIMARY KEY,
+        ip_id INTEGER NOT NULL REFERENCES ips (id) ON DELETE CASCADE,
+        test_time DATETIME,
+        latency_ms FLOAT,
+        download_speed_mbps FLOAT,
+        upload_speed_mbps FLOAT,
+        loss_rate FLOAT,
+        packets_sent INTEGER,
+        packets_received INTEGER,
+        colo_code VARCHAR(10),
+        test_type VARCHAR(20)
+    );
+    CREATE INDEX ix_test_results_ip_id ON test_results (ip_id);
+    CREATE INDEX ix_test_results_test_time ON test_results (test_time);
+
+    -- Two spellings of one IPv6 address, as older versions could store.
+    INSERT INTO ips (id, ip_address, is_active, total_tests, avg_latency,
+                     colo_code, first_seen)
+    VALUES (1, '2606:4700:0::1', 1, 2, 150, NULL, '2026-01-02 00:00:00'),
+           (2, '2606:4700::1', 0, 1, 300, 'FRA', '2026-01-01 00:00:00'),
+           (3, '104.16.0.1', 1, 1, 50, NULL, '2026-01-01 00:00:00');
+    INSERT INTO test_results (ip_id, test_time, latency_ms,
+                              download_speed_mbps, loss_rate)
+    VALUES (1, '2026-01-01 10:05:00', 100, 4.0, 0.0),
+           (1, '2026-01-01 10:35:00', 200, 6.0, 0.0),
+           (2, '2026-01-01 11:00:00', 300, 2.0, 0.5),
+           (3, '2026-01-01 11:10:00', 50, 20.0, 0.0);
+"""
+
+
+class UpgradeSchemaTest(AppTestCase):
+    def setUp(self):
+        conn = sqlite3.connect(DB_PATH)
+        conn.executescript(_BASELINE_SCHEMA)
+        conn.close()
+        super().setUp()
+
+    def test_baseline_database_is_upgraded(self):
+        indexes = {i["name"] for i in inspect(db.engine).get_indexes("ips")}
+        self.assertNotIn("ix_ips_is_active", indexes)
+        self.assertIn("ix_ips_active_speed", indexes)
+        self.assertIn("ix_ips_ip_packed", indexes)
+
+        rows = db.session.execute(
+            select(
+                IP.id, IP.ip_address, IP.ip_packed, IP.is_active, IP.total_tests,
+                IP.latency_count, IP.avg_latency, IP.worst_latency, IP.colo_code,
+            ).order_by(IP.id)
+        ).all()
+        self.assertEqual(
+            rows,
+            [
+                (2, "2606:4700::1", bytes.fromhex("26064700" + "0" * 23 + "1"),
+                 True, 3, 3, 200, 300, "FRA"),
+                (3, "104.16.0.1", bytes([104, 16, 0, 1]),
+                 True, 1, 1, 50, 50, None),
+            ],
+        )
+        self.assertEqual(
+            db.session.execute(
+                text("SELECT ip_id, COUNT(*) FROM test_results GROUP BY ip_id")
+            ).all(),
+            [(2, 3), (3, 1)],
+        )
+
+        hourly = db.session.execute(
+            select(TestResultHourly.hour, TestResultHourly.test_count)
+            .order_by(TestResultHourly.hour)
+        ).all()
+        self.assertEqual(
+            hourly, [("2026-01-01 10:00", 2), ("2026-01-01 11:00", 2)]
+        )